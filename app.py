@@ -4,6 +4,9 @@
 非遗AI智能问答 - Flask Web服务
 "图谱溯文脉・AI焕非遗"
 
+大模型生成类接口（chat/creative/wenmai/wenxue/generate-*）请求体带 "stream": true 时
+以 Server-Sent Events 流式返回: data: {"delta": "..."} ... data: {"done": true}
+
 API接口：
 - GET  /api/health        - 健康检查
 - GET  /api/stats         - 知识图谱统计
@@ -15,12 +18,19 @@ API接口：
 
 import os
 import json
-from flask import Flask, request, jsonify, render_template, send_from_directory
+import asyncio
+import threading
+from typing import Callable, Dict
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
 from flask_cors import CORS
+from flask_caching import Cache
+from flask.json.provider import DefaultJSONProvider
+from cachetools import TTLCache, cached
 from dotenv import load_dotenv
 import logging
 
-from rag_engine import ICHRAGEngine, Neo4jKnowledgeGraph
+from rag_engine import ICHRAGEngine, Neo4jKnowledgeGraph, EmbedBatcher
+from semantic_cache import semantic_cache
 
 # 加载.env文件
 load_dotenv()
@@ -29,16 +39,48 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """使用 orjson 序列化 jsonify 响应（图谱节点列表等较大的响应编码更快）"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__, static_folder='static', template_folder='templates')
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 CORS(app)
 
+# 统计类接口结果缓存；多进程部署时可设 CACHE_TYPE=RedisCache 与 CACHE_REDIS_URL 共享缓存
+cache = Cache(app, config={
+    'CACHE_TYPE': os.getenv('CACHE_TYPE', 'SimpleCache'),
+    'CACHE_REDIS_URL': os.getenv('CACHE_REDIS_URL'),
+    'CACHE_DEFAULT_TIMEOUT': 300
+})
+
+
 # Neo4j配置
 NEO4J_CONFIG = {
     'uri': os.getenv('NEO4J_URI', 'bolt://localhost:7687'),
     'user': os.getenv('NEO4J_USER', 'neo4j'),
-    'password': os.getenv('NEO4J_PASSWORD', 'password')
+    'password': os.getenv('NEO4J_PASSWORD', 'password'),
+    'database': os.getenv('NEO4J_DATABASE', 'neo4j'),
+    'max_connection_pool_size': int(os.getenv('NEO4J_MAX_CONNECTION_POOL_SIZE', 100))
 }
 
+# 图谱搜索的节点类型 → ECharts 类别下标，以及对应的类别列表
+_TYPE_TO_CAT = {'Item': 0, 'Category': 1, 'Region': 2, 'Organization': 3}
+_GRAPH_CATEGORIES = ({'name': '非遗项目'}, {'name': '类别'}, {'name': '地区'}, {'name': '保护单位'})
+
 # 初始化RAG引擎
 rag_engine = None
 kg = None
@@ -51,14 +93,230 @@ def init_engines():
         kg = Neo4jKnowledgeGraph(**NEO4J_CONFIG)
         # 使用向量索引（如果存在）
         vector_index_path = 'vector_index' if os.path.exists('vector_index') else None
-        rag_engine = ICHRAGEngine(neo4j_config=NEO4J_CONFIG, vector_index_path=vector_index_path)
+        engine = ICHRAGEngine(kg=kg, vector_index_path=vector_index_path)
+        # 向量检索器默认懒加载；服务进程在启动时预热，避免首个请求承担加载耗时。
+        # 预热完成后再发布全局引擎，失败时保持 None，走纯大模型兜底
+        engine.retriever.load()
+        rag_engine = engine
         logger.info("引擎初始化成功")
     except Exception as e:
         logger.error(f"引擎初始化失败: {e}")
 
 
 # ==================== 大模型调用 ====================
-def call_qwen_api(prompt: str) -> str:
+DASHSCOPE_URL = 'https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation'
+
+# 所有请求共用、逐字节一致的系统提示词，DashScope 据此命中前缀缓存（context cache）
+# 约定：提示词中静态内容在前、本次请求的动态内容（项目名、用户问题等）一律放在 user 消息末尾，
+# 不要在系统提示词或模板开头插入时间戳、用户ID等随请求变化的内容，否则前缀缓存失效
+SYSTEM_PROMPT = '你是一位中国非物质文化遗产专家，擅长讲解各类非遗的历史渊源、文化价值和传承意义。回答要专业、准确、有文化底蕴。'
+
+# ==================== 提示词模板 ====================
+# 模板正文固定不变，只在末尾的占位符处填入请求参数（str.format）
+CREATIVE_TPL = "请为以下非遗项目设计方案。要求：1. 结合传统元素与现代审美；2. 具有实用性或传播价值；3. 描述具体的设计理念和产品形态。\n\n方案类型：{c_type}\n非遗项目：{item_name}"
+
+WENMAI_TPL = """请追溯以下非遗项目的历史渊源与文化脉络。要求：
+1. 介绍该项目的起源年代和发源地
+2. 阐述其历史演变过程和重要节点
+3. 分析其与当地文化、民俗、信仰的关联
+4. 探讨其在当代的传承现状和文化价值
+5. 语言要有文化底蕴，像讲述一段历史故事
+
+非遗项目：{project_name}"""
+
+WENXUE_TPL_POEM = '请以下面的主题创作一首七言或五言古诗。要求意境优美，富有文化韵味。\n\n主题：{theme}'
+WENXUE_TPL_CI = '请以下面的主题创作一首词（可选词牌：如《水调歌头》《念奴娇》《满江红》等）。要求格律工整，意境深远。\n\n主题：{theme}'
+WENXUE_TPL_STORY = '请以下面的主题创作一个约500字的文化故事。要求故事生动，有传承精神和时代意义。\n\n主题：{theme}'
+WENXUE_TPLS = {'诗': WENXUE_TPL_POEM, '词': WENXUE_TPL_CI, '故事': WENXUE_TPL_STORY}
+
+POEM_TPL = """请以下面的非遗项目为主题，创作一首古风诗词（五言或七言），
+要求：
+1. 体现该非遗项目的文化特色
+2. 语言优美，意境深远
+3. 表达对非遗传承的敬意
+
+请直接给出诗词内容，不需要解释。
+
+非遗项目：{project_name}"""
+
+STORY_CONTINUE_TPL = """请续写下面这个关于非遗项目的故事（约300字），要求：
+1. 延续故事风格
+2. 融入该非遗的文化元素
+3. 结局富有寓意
+
+非遗项目：{project_name}
+故事开头：
+{story_start}"""
+
+STORY_NEW_TPL = """请创作一个关于下面这个非遗项目的短篇故事（约400字），
+要求：
+1. 故事生动有趣
+2. 融入该非遗的历史和技艺
+3. 体现文化传承的主题
+
+非遗项目：{project_name}"""
+
+CHAT_FALLBACK_TPL = "作为非遗专家，请回答：{message}"
+
+# 所有大模型请求在同一个后台事件循环上发出，使 AsyncClient 的连接池能在请求之间复用
+# （Flask 的异步视图每个请求都会新建事件循环，无法直接共享客户端）
+_io_loop = None
+_io_loop_lock = threading.Lock()
+_http_client = None
+
+
+def _get_io_loop() -> asyncio.AbstractEventLoop:
+    """懒启动后台事件循环线程（gunicorn 等 fork 模式下在子进程中启动）"""
+    global _io_loop
+    with _io_loop_lock:
+        if _io_loop is None:
+            _io_loop = asyncio.new_event_loop()
+            threading.Thread(target=_io_loop.run_forever, name='llm-io-loop', daemon=True).start()
+    return _io_loop
+
+
+def _run_on_io_loop(coro):
+    """在后台事件循环上执行协程，并在当前事件循环中等待结果"""
+    return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _get_io_loop()))
+
+
+# 查询/提示词向量编码合并批处理，批处理任务运行在后台事件循环上
+_embed_batcher = EmbedBatcher(max_batch=32, max_wait=0.01)
+
+
+async def batched_embed(text: str):
+    """通过批量编码器生成文本向量，可在任意事件循环中调用"""
+    return await _run_on_io_loop(_embed_batcher.encode(text))
+
+
+class QwenAPIError(Exception):
+    """通义千问API返回非200状态"""
+
+
+def _get_http_client():
+    """共享的 httpx.AsyncClient，只能在后台事件循环中使用"""
+    global _http_client
+    if _http_client is None:
+        import httpx
+        try:
+            import h2  # noqa: F401  安装 httpx[http2] 后启用 HTTP/2 多路复用
+            http2 = True
+        except ImportError:
+            http2 = False
+        _http_client = httpx.AsyncClient(
+            http2=http2,
+            timeout=30,
+            limits=httpx.Limits(max_connections=200),
+            headers={'Content-Type': 'application/json'}
+        )
+    return _http_client
+
+
+def _build_payload(prompt: str, stream: bool = False) -> Dict:
+    """构造 DashScope 文本生成请求体"""
+    parameters = {'result_format': 'message'}
+    if stream:
+        parameters['incremental_output'] = True
+    return {
+        'model': 'qwen-max',
+        'input': {
+            'messages': [
+                {'role': 'system', 'content': SYSTEM_PROMPT},
+                {'role': 'user', 'content': prompt}
+            ]
+        },
+        'parameters': parameters
+    }
+
+
+async def _post_generation(payload: Dict, api_key: str) -> Dict:
+    """调用 DashScope REST 接口（运行于后台事件循环）"""
+    # 请求/响应体统一走 app.json（安装了 orjson 时即为 orjson）
+    response = await _get_http_client().post(
+        DASHSCOPE_URL,
+        content=app.json.dumps(payload),
+        headers={'Authorization': f'Bearer {api_key}'}
+    )
+    data = app.json.loads(response.content)
+    if response.status_code != 200:
+        raise QwenAPIError(data.get('message', response.status_code))
+    return data
+
+
+async def _stream_generation(payload: Dict, api_key: str):
+    """以流式模式调用 DashScope，逐段产出增量文本（运行于后台事件循环）"""
+    async with _get_http_client().stream(
+        'POST',
+        DASHSCOPE_URL,
+        content=app.json.dumps(payload),
+        headers={'Authorization': f'Bearer {api_key}', 'X-DashScope-SSE': 'enable'}
+    ) as response:
+        if response.status_code != 200:
+            data = app.json.loads(await response.aread())
+            raise QwenAPIError(data.get('message', response.status_code))
+        
+        async for line in response.aiter_lines():
+            if line.startswith('data:'):
+                data = app.json.loads(line[5:])
+                yield data['output']['choices'][0]['message']['content']
+
+
+def _iter_on_io_loop(agen):
+    """在后台事件循环上逐项消费异步生成器，供同步的流式响应使用"""
+    loop = _get_io_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        # 客户端断开时也要关闭上游连接
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+
+def _generate_with_sdk(prompt: str, api_key: str) -> str:
+    """未安装 httpx 时的兜底：使用 dashscope SDK 同步调用"""
+    from dashscope import Generation
+    
+    response = Generation.call(
+        model='qwen-max',
+        api_key=api_key,
+        messages=_build_payload(prompt)['input']['messages'],
+        result_format='message'
+    )
+    if response.status_code != 200:
+        raise QwenAPIError(response.message)
+    return response.output.choices[0].message.content
+
+
+# 所有提示词都是"长模板 + 末尾少量变量"，且 RAG 提示词中问题排在上下文之后、会被嵌入模型截断，
+# 整段提示词的向量无法区分不同请求，因此只用 L1 精确缓存
+@semantic_cache(
+    ttl=int(os.getenv('SEMANTIC_CACHE_TTL', 3600)),
+    semantic=False
+)
+async def _generate_with_qwen(prompt: str) -> str:
+    """调用通义千问生成回答，失败时抛出异常（异常结果不进入缓存）"""
+    api_key = os.getenv('QWEN_API_KEY') or os.getenv('DASHSCOPE_API_KEY')
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        return await asyncio.to_thread(_generate_with_sdk, prompt, api_key)
+    
+    data = await _run_on_io_loop(_post_generation(_build_payload(prompt), api_key))
+    return data['output']['choices'][0]['message']['content']
+
+
+# call_qwen_api / 流式接口出错时返回的提示信息前缀
+LLM_ERROR_PREFIXES = ('API密钥未配置', 'AI服务暂时不可用', '请安装', '生成回答时出错')
+
+
+def _is_llm_error(answer: str) -> bool:
+    return answer.startswith(LLM_ERROR_PREFIXES)
+
+
+async def call_qwen_api(prompt: str) -> str:
     """调用通义千问API"""
     api_key = os.getenv('QWEN_API_KEY') or os.getenv('DASHSCOPE_API_KEY')
     
@@ -66,31 +324,78 @@ def call_qwen_api(prompt: str) -> str:
         return "API密钥未配置，无法生成AI回答。请设置 QWEN_API_KEY 环境变量。"
     
     try:
-        import dashscope
-        from dashscope import Generation
-        
-        dashscope.api_key = api_key
-        
-        response = Generation.call(
-            model='qwen-max',
-            messages=[
-                {'role': 'system', 'content': '你是一位中国非物质文化遗产专家，擅长讲解各类非遗的历史渊源、文化价值和传承意义。回答要专业、准确、有文化底蕴。'},
-                {'role': 'user', 'content': prompt}
-            ],
-            result_format='message'
-        )
-        
-        if response.status_code == 200:
-            return response.output.choices[0].message.content
-        else:
-            return f"AI服务暂时不可用: {response.message}"
+        return await _generate_with_qwen(prompt)
+    except QwenAPIError as e:
+        return f"AI服务暂时不可用: {e}"
     except ImportError:
-        return "请安装 dashscope 库: pip install dashscope"
+        return "请安装 httpx 或 dashscope 库: pip install httpx"
     except Exception as e:
         logger.error(f"API调用错误: {e}")
         return f"生成回答时出错: {str(e)}"
 
 
+def _sse(payload: Dict) -> str:
+    return f"data: {app.json.dumps(payload)}\n\n"
+
+
+def _stream_qwen_api(prompt: str, meta: Dict = None, on_error: Callable = None):
+    """
+    流式调用通义千问，产出SSE事件
+    
+    事件顺序: [meta] → {'delta': 文本片段}... → {'done': true}
+    出错时与 call_qwen_api 一致，把提示信息作为 delta 输出，并调用 on_error()
+    """
+    if meta:
+        yield _sse(meta)
+    
+    api_key = os.getenv('QWEN_API_KEY') or os.getenv('DASHSCOPE_API_KEY')
+    if not api_key:
+        if on_error:
+            on_error()
+        yield _sse({'delta': "API密钥未配置，无法生成AI回答。请设置 QWEN_API_KEY 环境变量。"})
+        yield _sse({'done': True})
+        return
+    
+    # 与非流式调用共用回答缓存（按提示词精确匹配）
+    llm_cache = _generate_with_qwen.cache
+    cached_answer = llm_cache.get(prompt)
+    
+    if cached_answer is not None:
+        yield _sse({'delta': cached_answer})
+    else:
+        chunks = []
+        try:
+            for chunk in _iter_on_io_loop(_stream_generation(_build_payload(prompt, stream=True), api_key)):
+                chunks.append(chunk)
+                yield _sse({'delta': chunk})
+        except QwenAPIError as e:
+            if on_error:
+                on_error()
+            yield _sse({'delta': f"AI服务暂时不可用: {e}"})
+        except ImportError:
+            if on_error:
+                on_error()
+            yield _sse({'delta': "请安装 httpx 库: pip install httpx"})
+        except Exception as e:
+            logger.error(f"API流式调用错误: {e}")
+            if on_error:
+                on_error()
+            yield _sse({'delta': f"生成回答时出错: {str(e)}"})
+        else:
+            llm_cache.put(prompt, ''.join(chunks))
+    
+    yield _sse({'done': True})
+
+
+def stream_response(prompt: str, meta: Dict = None, on_error: Callable = None) -> Response:
+    """以 text/event-stream 返回大模型的流式回答，生成失败时调用 on_error()"""
+    return Response(
+        stream_with_context(_stream_qwen_api(prompt, meta, on_error)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 # ==================== API 路由 ====================
 
 @app.route('/')
@@ -110,7 +415,13 @@ def health():
     })
 
 
+def _is_success(rv) -> bool:
+    """只缓存成功响应（出错时视图返回 (响应, 状态码) 元组）"""
+    return not isinstance(rv, tuple)
+
+
 @app.route('/api/stats')
+@cache.cached(timeout=300, response_filter=_is_success)
 def get_stats():
     """获取知识图谱统计"""
     if not kg or not kg.driver:
@@ -130,6 +441,7 @@ def get_stats():
 
 
 @app.route('/api/categories')
+@cache.cached(timeout=300, response_filter=_is_success)
 def get_categories():
     """获取类别分布"""
     if not kg or not kg.driver:
@@ -148,69 +460,52 @@ def get_categories():
 
 
 @app.route('/api/graph/init')
+@cache.cached(timeout=300, key_prefix='view/graph_init', response_filter=_is_success)
 def graph_init():
     """获取初始图谱数据"""
     if not kg or not kg.driver:
         return jsonify({'error': '知识图谱未连接'}), 503
     
     try:
-        # 获取部分节点和关系用于展示
-        with kg.driver.session() as session:
-            result = session.run("""
-                MATCH (n:Item)-[r]->(m)
-                RETURN n, r, m LIMIT 30
-            """)
-            
-            nodes = []
-            links = []
-            node_ids = set()
-            categories = set()
-            
-            for record in result:
-                n = record['n']
-                m = record['m']
-                r = record['r']
-                
-                # 处理节点
-                for node in [n, m]:
-                    if node.id not in node_ids:
-                        node_ids.add(node.id)
-                        # 确定类别
-                        category = 'Item'
-                        if 'Category' in node.labels:
-                            category = 'Category'
-                        elif 'Region' in node.labels:
-                            category = 'Region'
-                        
-                        nodes.append({
-                            'id': str(node.id),
-                            'name': node.get('name', 'Unknown'),
-                            'category': category, # ECharts category index logic needed usually, simplified here
-                            'symbolSize': 20 if category == 'Item' else 30,
-                            'draggable': True
-                        })
-                        categories.add(category)
-
-                # 处理关系
-                links.append({
-                    'source': str(n.id),
-                    'target': str(m.id),
-                    'name': type(r).__name__
-                })
-            
-            # format categories for echarts
-            unique_categories = list(categories)
-            # map node category string to index
-            for node in nodes:
-                node['category'] = unique_categories.index(node['category'])
-
-            cat_objs = [{'name': c} for c in unique_categories]
-                
-            return jsonify({
-                'nodes': nodes,
-                'links': links,
-                'categories': cat_objs
-            })
+        # 获取部分节点和关系用于展示：节点去重、类别判定与关系投影都在 Cypher 中完成
+        records = kg.read("""
+            MATCH (n:Item)-[r]->(m)
+            WITH n, r, m LIMIT 30
+            WITH collect(n) + collect(m) AS ns,
+                 collect({source: toString(id(n)), target: toString(id(m)), name: type(r)}) AS links
+            UNWIND ns AS node
+            WITH DISTINCT links, node
+            WITH links, node,
+                 CASE WHEN 'Category' IN labels(node) THEN 'Category'
+                      WHEN 'Region' IN labels(node) THEN 'Region'
+                      ELSE 'Item' END AS category
+            RETURN links, collect({
+                id: toString(id(node)),
+                name: coalesce(node.name, 'Unknown'),
+                category: category,
+                symbolSize: CASE category WHEN 'Item' THEN 20 ELSE 30 END,
+                draggable: true
+            }) AS nodes
+        """)
+        
+        if not records:
+            return jsonify({'nodes': [], 'links': [], 'categories': []})
+        
+        nodes = records[0]['nodes']
+        links = records[0]['links']
+        
+        # format categories for echarts: map node category string to index
+        present = {node['category'] for node in nodes}
+        unique_categories = [c for c in ('Item', 'Category', 'Region') if c in present]
+        cat_index = {c: i for i, c in enumerate(unique_categories)}
+        for node in nodes:
+            node['category'] = cat_index[node['category']]
+        
+        return jsonify({
+            'nodes': nodes,
+            'links': links,
+            'categories': [{'name': c} for c in unique_categories]
+        })
     except Exception as e:
         logger.error(f"图谱初始化失败: {e}")
         return jsonify({'error': str(e)}), 500
@@ -227,91 +522,64 @@ def graph_search():
         return graph_init()
         
     try:
-        with kg.driver.session() as session:
-            # 按优先级依次搜索各类型节点
-            node_types = ['Item', 'Category', 'Region', 'Organization']
-            center_node = None
-            center_type = None
-            
-            for node_type in node_types:
-                result = session.run(f"""
-                    MATCH (n:{node_type}) WHERE n.name CONTAINS $q
-                    RETURN n LIMIT 1
-                """, q=query)
-                record = result.single()
-                if record and record['n']:
-                    center_node = record['n']
-                    center_type = node_type
+        # 一次查询完成：按优先级取中心节点（priority 即类别下标）并收集去重后的邻居及关系类型
+        records = kg.read("""
+            CALL {
+                MATCH (n:Item) WHERE n.name CONTAINS $q RETURN n, 0 AS priority LIMIT 1
+                UNION ALL
+                MATCH (n:Category) WHERE n.name CONTAINS $q RETURN n, 1 AS priority LIMIT 1
+                UNION ALL
+                MATCH (n:Region) WHERE n.name CONTAINS $q RETURN n, 2 AS priority LIMIT 1
+                UNION ALL
+                MATCH (n:Organization) WHERE n.name CONTAINS $q RETURN n, 3 AS priority LIMIT 1
+            }
+            WITH n, priority ORDER BY priority LIMIT 1
+            OPTIONAL MATCH (n)-[r]-(m)
+            WITH n, priority, m, head(collect(type(r))) AS rtype
+            WITH n, priority,
+                 collect(CASE WHEN m IS NOT NULL
+                         THEN {id: elementId(m), name: m.name, labels: labels(m), rtype: rtype} END) AS neighbors
+            RETURN elementId(n) AS id, n.name AS name, priority, neighbors
+        """, q=query)
+        record = records[0] if records else None
+        
+        if not record:
+            return jsonify({'nodes': [], 'links': [], 'categories': [], 'message': '未找到匹配节点'})
+        
+        center_id = record['id']
+        nodes = [{
+            'id': center_id,
+            'name': record['name'],
+            'category': record['priority'],
+            'symbolSize': 50,
+            'itemStyle': {'color': '#C00000'}
+        }]
+        links = []
+        
+        for m in record['neighbors']:
+            cat_idx = 0
+            for label in m['labels']:
+                if label in _TYPE_TO_CAT:
+                    cat_idx = _TYPE_TO_CAT[label]
                     break
             
-            if not center_node:
-                return jsonify({'nodes': [], 'links': [], 'categories': [], 'message': '未找到匹配节点'})
-            
-            # 获取中心节点的所有关联
-            result = session.run("""
-                MATCH (n) WHERE elementId(n) = $node_id
-                OPTIONAL MATCH (n)-[r]-(m)
-                RETURN n, labels(n) as n_labels, m, labels(m) as m_labels
-            """, node_id=center_node.element_id)
-            
-            nodes = []
-            links = []
-            node_ids = set()
-            
-            type_to_cat = {'Item': 0, 'Category': 1, 'Region': 2, 'Organization': 3}
-            
-            for record in result:
-                n = record['n']
-                n_labels = record['n_labels']
-                
-                # 添加中心节点
-                if n.element_id not in node_ids:
-                    node_ids.add(n.element_id)
-                    cat_idx = type_to_cat.get(center_type, 0)
-                    nodes.append({
-                        'id': n.element_id,
-                        'name': n.get('name'),
-                        'category': cat_idx,
-                        'symbolSize': 50,
-                        'itemStyle': {'color': '#C00000'}
-                    })
-                
-                m = record['m']
-                m_labels = record['m_labels'] or []
-                
-                if m:
-                    if m.element_id not in node_ids:
-                        node_ids.add(m.element_id)
-                        cat_idx = 0
-                        for label in m_labels:
-                            if label in type_to_cat:
-                                cat_idx = type_to_cat[label]
-                                break
-                        
-                        nodes.append({
-                            'id': m.element_id,
-                            'name': m.get('name'),
-                            'category': cat_idx,
-                            'symbolSize': 30
-                        })
-                    
-                    links.append({
-                        'source': n.element_id,
-                        'target': m.element_id
-                    })
-            
-            categories = [
-                {'name': '非遗项目'},
-                {'name': '类别'},
-                {'name': '地区'},
-                {'name': '保护单位'}
-            ]
-            
-            return jsonify({
-                'nodes': nodes,
-                'links': links,
-                'categories': categories
+            nodes.append({
+                'id': m['id'],
+                'name': m['name'],
+                'category': cat_idx,
+                'symbolSize': 30
+            })
+            links.append({
+                'source': center_id,
+                'target': m['id'],
+                'name': m['rtype']
             })
+        
+        return jsonify({
+            'nodes': nodes,
+            'links': links,
+            'categories': _GRAPH_CATEGORIES
+        })
 
     except Exception as e:
         logger.error(f"图谱搜索失败: {e}")
@@ -319,15 +587,18 @@ def graph_search():
 
 
 @app.route('/api/creative', methods=['POST'])
-def creative_gen():
+async def creative_gen():
     """创意工坊统一接口"""
     data = request.get_json()
     c_type = data.get('type', '文创设计')
     item_name = data.get('item_name', '非遗项目')
     
-    prompt = f"请为非遗项目“{item_name}”设计一个{c_type}方案。要求：1. 结合传统元素与现代审美；2. 具有实用性或传播价值；3. 描述具体的设计理念和产品形态。"
+    prompt = CREATIVE_TPL.format(c_type=c_type, item_name=item_name)
+    
+    if data.get('stream'):
+        return stream_response(prompt, {'title': f"{item_name} - {c_type}方案"})
     
-    content = call_qwen_api(prompt)
+    content = await call_qwen_api(prompt)
     
     return jsonify({
         'title': f"{item_name} - {c_type}方案",
@@ -336,19 +607,17 @@ def creative_gen():
 
 
 @app.route('/api/wenmai', methods=['POST'])
-def wenmai_gen():
+async def wenmai_gen():
     """文脉溯源接口"""
     data = request.get_json()
     project_name = data.get('project_name', '非遗项目')
     
-    prompt = f"""请追溯非遗项目"{project_name}"的历史渊源与文化脉络。要求：
-1. 介绍该项目的起源年代和发源地
-2. 阐述其历史演变过程和重要节点
-3. 分析其与当地文化、民俗、信仰的关联
-4. 探讨其在当代的传承现状和文化价值
-5. 语言要有文化底蕴，像讲述一段历史故事"""
+    prompt = WENMAI_TPL.format(project_name=project_name)
+    
+    if data.get('stream'):
+        return stream_response(prompt, {'title': f'{project_name} - 文脉溯源'})
     
-    content = call_qwen_api(prompt)
+    content = await call_qwen_api(prompt)
     
     return jsonify({
         'title': f'{project_name} - 文脉溯源',
@@ -357,20 +626,17 @@ def wenmai_gen():
 
 
 @app.route('/api/wenxue', methods=['POST'])
-def wenxue_gen():
+async def wenxue_gen():
     """文学创作接口"""
     data = request.get_json()
     theme = data.get('theme', '非遗传承')
     creation_type = data.get('type', '诗')
     
-    type_prompts = {
-        '诗': f'请以"{theme}"为主题，创作一首七言或五言古诗。要求意境优美，富有文化韵味。',
-        '词': f'请以"{theme}"为主题，创作一首词（可选词牌：如《水调歌头》《念奴娇》《满江红》等）。要求格律工整，意境深远。',
-        '故事': f'请以"{theme}"为主题，创作一个约500字的文化故事。要求故事生动，有传承精神和时代意义。'
-    }
+    prompt = WENXUE_TPLS.get(creation_type, WENXUE_TPL_POEM).format(theme=theme)
+    if data.get('stream'):
+        return stream_response(prompt, {'title': f'{theme} - {creation_type}'})
     
-    prompt = type_prompts.get(creation_type, type_prompts['诗'])
-    content = call_qwen_api(prompt)
+    content = await call_qwen_api(prompt)
     
     return jsonify({
         'title': f'{theme} - {creation_type}',
@@ -408,23 +674,63 @@ def search():
         return jsonify({'error': str(e)}), 500
 
 
+# 问答消息长度限制，以及重复提交拦截窗口（秒）
+CHAT_MIN_LENGTH = 2
+CHAT_MAX_LENGTH = 2000
+_recent_chats = TTLCache(maxsize=10000, ttl=5)
+_recent_chats_lock = threading.Lock()
+
+
 @app.route('/api/chat', methods=['POST'])
-def chat():
+async def chat():
     """智能问答"""
     data = request.get_json()
     if not data or 'message' not in data:
         return jsonify({'error': '请提供消息内容'}), 400
     
     user_message = data['message']
+    if not isinstance(user_message, str):
+        return jsonify({'error': '请提供消息内容'}), 400
+    user_message = user_message.strip()
+    if not (CHAT_MIN_LENGTH <= len(user_message) <= CHAT_MAX_LENGTH):
+        return jsonify({'error': '消息长度无效'}), 400
+    
+    # 拦截同一客户端短时间内的重复提交（如连点发送）
+    dedup_key = (request.remote_addr, hash(user_message))
+    with _recent_chats_lock:
+        if dedup_key in _recent_chats:
+            return jsonify({'error': '请勿重复提交'}), 429
+        _recent_chats[dedup_key] = True
+    
+    def _release():
+        # 请求失败时撤销拦截记录，允许用户立即重试
+        with _recent_chats_lock:
+            _recent_chats.pop(dedup_key, None)
+    
     use_ai = data.get('use_ai', True)
     
     try:
+        if use_ai and data.get('stream'):
+            # 流式输出：先完成检索，再边生成边推送
+            if rag_engine:
+                retrieval = await rag_engine.retrieve_async(user_message, embed_func=batched_embed)
+                return stream_response(rag_engine.build_prompt(user_message, retrieval), {
+                    'sources': [item.get('名称', '') for item in retrieval['kg_results'][:5]],
+                    'intent': retrieval['intent']
+                }, on_error=_release)
+            return stream_response(CHAT_FALLBACK_TPL.format(message=user_message), {
+                'sources': [],
+                'intent': {'type': 'unknown', 'keyword': user_message}
+            }, on_error=_release)
+        
         if rag_engine:
             # 使用RAG引擎
             if use_ai:
-                result = rag_engine.answer(user_message, llm_func=call_qwen_api)
+                result = await rag_engine.answer_async(user_message, llm_func=call_qwen_api, embed_func=batched_embed)
             else:
-                result = rag_engine.answer(user_message)
+                result = await asyncio.to_thread(rag_engine.answer, user_message)
+            if _is_llm_error(result['answer']):
+                _release()
             
             return jsonify({
                 'answer': result['answer'],
@@ -434,9 +740,11 @@ def chat():
         else:
             # 降级：直接调用大模型
             if use_ai:
-                answer = call_qwen_api(f"作为非遗专家，请回答：{user_message}")
+                answer = await call_qwen_api(CHAT_FALLBACK_TPL.format(message=user_message))
             else:
                 answer = "RAG引擎未初始化"
+            if _is_llm_error(answer):
+                _release()
             
             return jsonify({
                 'answer': answer,
@@ -445,9 +753,16 @@ def chat():
             })
     except Exception as e:
         logger.error(f"问答错误: {e}")
+        _release()
         return jsonify({'error': str(e)}), 500
 
 
+@cached(cache=TTLCache(maxsize=4096, ttl=int(os.getenv('PROJECT_CACHE_TTL', 600))), lock=threading.Lock())
+def _project_by_name(name: str) -> tuple:
+    """按名称查询项目（带TTL缓存，项目名集合基本固定）"""
+    return tuple(kg.query_by_name(name))
+
+
 @app.route('/api/project/<name>')
 def get_project(name: str):
     """获取项目详情"""
@@ -455,12 +770,12 @@ def get_project(name: str):
         return jsonify({'error': '知识图谱未连接'}), 503
     
     try:
-        results = kg.query_by_name(name)
+        results = _project_by_name(name)
         if results:
             return jsonify({
                 'found': True,
                 'project': results[0],
-                'related': results[1:5] if len(results) > 1 else []
+                'related': list(results[1:5])
             })
         else:
             return jsonify({'found': False, 'project': None})
@@ -469,7 +784,7 @@ def get_project(name: str):
 
 
 @app.route('/api/generate-poem', methods=['POST'])
-def generate_poem():
+async def generate_poem():
     """AI生成非遗主题诗词"""
     data = request.get_json()
     project_name = data.get('project_name', '')
@@ -477,15 +792,12 @@ def generate_poem():
     if not project_name:
         return jsonify({'error': '请提供非遗项目名称'}), 400
     
-    prompt = f"""请以"{project_name}"为主题，创作一首古风诗词（五言或七言），
-要求：
-1. 体现该非遗项目的文化特色
-2. 语言优美，意境深远
-3. 表达对非遗传承的敬意
-
-请直接给出诗词内容，不需要解释。"""
+    prompt = POEM_TPL.format(project_name=project_name)
     
-    poem = call_qwen_api(prompt)
+    if data.get('stream'):
+        return stream_response(prompt, {'project': project_name})
+    
+    poem = await call_qwen_api(prompt)
     
     return jsonify({
         'project': project_name,
@@ -494,7 +806,7 @@ def generate_poem():
 
 
 @app.route('/api/generate-story', methods=['POST'])
-def generate_story():
+async def generate_story():
     """AI续写非遗故事"""
     data = request.get_json()
     project_name = data.get('project_name', '')
@@ -504,22 +816,14 @@ def generate_story():
         return jsonify({'error': '请提供非遗项目名称'}), 400
     
     if story_start:
-        prompt = f"""关于"{project_name}"的故事：
-
-{story_start}
-
-请续写这个故事（约300字），要求：
-1. 延续故事风格
-2. 融入该非遗的文化元素
-3. 结局富有寓意"""
+        prompt = STORY_CONTINUE_TPL.format(project_name=project_name, story_start=story_start)
     else:
-        prompt = f"""请创作一个关于"{project_name}"的短篇故事（约400字），
-要求：
-1. 故事生动有趣
-2. 融入该非遗的历史和技艺
-3. 体现文化传承的主题"""
+        prompt = STORY_NEW_TPL.format(project_name=project_name)
+    
+    if data.get('stream'):
+        return stream_response(prompt, {'project': project_name})
     
-    story = call_qwen_api(prompt)
+    story = await call_qwen_api(prompt)
     
     return jsonify({
         'project': project_name,
@@ -548,4 +852,5 @@ if __name__ == '__main__':
 ╚══════════════════════════════════════════════════════════╝
     """)
     
+    logger.warning("当前为 Flask 开发服务器，仅用于本地调试；生产环境请使用: gunicorn -c gunicorn_conf.py")
     app.run(host='0.0.0.0', port=port, debug=debug)
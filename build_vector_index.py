@@ -9,6 +9,21 @@ import json
 import os
 from rag_engine import VectorRetriever
 
+
+def _use_gpu_fp16(retriever: VectorRetriever):
+    """有CUDA时把嵌入模型移到GPU并转为FP16，加速离线批量编码"""
+    try:
+        import torch
+    except ImportError:
+        return
+    
+    model = retriever.load().embeddings_model
+    # ONNX 后端（EMBEDDING_BACKEND=onnx）不支持 .half()，保持原样
+    if model is not None and getattr(model, 'backend', 'torch') == 'torch' and torch.cuda.is_available():
+        retriever.embeddings_model = retriever.embeddings_model.to('cuda').half()
+        print("⚡ 使用 GPU (FP16) 编码")
+
+
 def build_vector_index():
     """构建向量索引"""
     
@@ -40,9 +55,10 @@ def build_vector_index():
     # 构建向量索引
     print("🔨 开始构建向量索引...")
     retriever = VectorRetriever()
+    _use_gpu_fp16(retriever)
     
     index_path = 'vector_index'
-    retriever.build_index(documents, save_path=index_path)
+    retriever.build_index(documents, save_path=index_path, batch_size=256)
     
     print(f"✅ 向量索引已保存至 {index_path}/")
     print("\n现在可以在 app.py 中使用向量检索功能了！")
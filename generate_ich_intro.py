@@ -16,77 +16,395 @@
 
 import os
 import json
+import re
 import csv
 import time
-from typing import Optional, List, Dict
+import sqlite3
+import hashlib
+import random
+import asyncio
+import itertools
+import weakref
+from typing import Optional, List, Dict, Tuple
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 单次生成的输出上限（300-500 字约 600 token），也用于预估每个请求消耗的 token 数
+MAX_OUTPUT_TOKENS = 600
+# 单次请求超时（秒）
+REQUEST_TIMEOUT = 20
+# 限流/超时的最大重试次数（只由 RateLimiter 重试，SDK 内部不再重试）
+MAX_RETRIES = 3
+
+
+class RateLimitError(Exception):
+    """接口返回限流（HTTP 429），由调用方退避后重试"""
+    pass
+
+
+# 可退避重试的异常：限流与请求超时
+RETRYABLE_ERRORS = (RateLimitError, asyncio.TimeoutError)
+
+
+class AsyncTokenBucket:
+    """
+    异步令牌桶：每 period 秒补充 rate 个令牌，令牌不足时等待而不是报错
+    
+    用于按服务商公布的 RPM / TPM 主动限速。
+    """
+    
+    def __init__(self, rate: float, period: float = 60.0):
+        self.capacity = rate
+        self.tokens = rate
+        self.fill_rate = rate / period
+        self._updated = time.monotonic()
+        self._lock = None
+    
+    async def acquire(self, amount: float = 1):
+        # 单次需求超过桶容量时按满桶计，避免永远等不到
+        amount = min(amount, self.capacity)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.fill_rate)
+                self._updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.fill_rate)
+
+
+class RateLimiter:
+    """按 RPM + TPM 主动限速，遇到 429 或超时时指数退避（带抖动）重试"""
+    
+    def __init__(self, rpm: float = 60, tpm: float = 100000,
+                 max_retries: int = MAX_RETRIES, backoff_base: float = 1.0, backoff_cap: float = 60.0):
+        self.requests = AsyncTokenBucket(rpm)
+        self.tokens = AsyncTokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+    
+    @staticmethod
+    def estimate_tokens(prompt: str, max_tokens: int = MAX_OUTPUT_TOKENS) -> int:
+        """粗略估算：中文约 2 字符 1 token，再加上输出上限"""
+        return len(prompt) // 2 + max_tokens
+    
+    async def call(self, func, prompt: str, *args, max_tokens: int = MAX_OUTPUT_TOKENS) -> Optional[str]:
+        estimated = self.estimate_tokens(prompt, max_tokens)
+        for attempt in range(self.max_retries + 1):
+            await self.requests.acquire()
+            await self.tokens.acquire(estimated)
+            try:
+                return await func(prompt, *args, max_tokens=max_tokens)
+            except RETRYABLE_ERRORS as e:
+                reason = '限流' if isinstance(e, RateLimitError) else '超时'
+                if attempt == self.max_retries:
+                    logger.error(f"接口持续{reason}，已重试 {self.max_retries} 次: {e}")
+                    return None
+                wait = min(self.backoff_cap, self.backoff_base * 2 ** attempt + random.uniform(0, 1))
+                logger.warning(f"接口{reason}，{wait:.1f} 秒后重试（第 {attempt + 1} 次）")
+                await asyncio.sleep(wait)
+
+
+SYSTEM_PROMPT = '你是一位中国非物质文化遗产研究专家，熟悉各类非遗项目的历史渊源、技艺特点和文化价值。'
+
+DASHSCOPE_URL = 'https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation'
+
+QWEN_MODEL = 'qwen-max'  # 或 qwen-turbo, qwen-plus
+OPENAI_MODEL = 'gpt-3.5-turbo'
+
+# 提示词模板版本，修改介绍模板后递增，使旧缓存失效
+PROMPT_VERSION = 1
+
+
+# ===================== 结果缓存 =====================
+class LLMCache:
+    """
+    按输入内容寻址的生成结果缓存（SQLite）
+    
+    键为 模型 + 项目四个字段 + 模板版本 的 SHA-256，重复运行时命中即跳过接口调用。
+    生成带随机性（temperature > 0），只在调用方显式开启时使用。
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        # 自动提交 + WAL，写入即落盘且不阻塞读
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS llm_cache ('
+            'key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at INTEGER)'
+        )
+    
+    @staticmethod
+    def make_key(model: str, name: str, category: str, region: str, organization: str) -> str:
+        raw = json.dumps({
+            'model': model, 'name': name, 'category': category,
+            'region': region, 'organization': organization,
+            'template_v': PROMPT_VERSION
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        row = self.conn.execute('SELECT response FROM llm_cache WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+    
+    def put(self, key: str, model: str, response: str):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO llm_cache (key, model, response, created_at) VALUES (?, ?, ?, ?)',
+            (key, model, response, int(time.time()))
+        )
+    
+    def close(self):
+        self.conn.close()
+
+
+def _request_timeout(max_tokens: int) -> float:
+    """多项合并请求的输出更长，超时按输出上限等比放宽"""
+    return REQUEST_TIMEOUT * max(1, max_tokens // MAX_OUTPUT_TOKENS)
+
+
+# ===================== 连接复用 =====================
+# 整个批量任务共用一个 httpx.AsyncClient（keep-alive 连接池，装了 h2 时走 HTTP/2），
+# 省去每个请求的 TCP + TLS 握手。客户端绑定创建它的事件循环，因此按事件循环分别缓存：
+# 多次 asyncio.run 时各自新建，不会复用已关闭循环上的连接；任务结束时由 close_clients() 关闭
+_http_clients = weakref.WeakKeyDictionary()
+_openai_clients = weakref.WeakKeyDictionary()
+
+
+def _get_http_client():
+    """当前事件循环共享的 httpx.AsyncClient，未安装 httpx 时抛出 ImportError"""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        import httpx
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        client = httpx.AsyncClient(
+            http2=http2,
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50)
+        )
+        _http_clients[loop] = client
+    return client
+
+
+def _get_openai_client(api_key: str, base_url: str):
+    clients = _openai_clients.setdefault(asyncio.get_running_loop(), {})
+    key = (api_key, base_url)
+    client = clients.get(key)
+    if client is None:
+        import openai
+        
+        # 关闭 SDK 内置重试：429 与超时统一交给 RateLimiter 退避重试，避免两层重试叠加
+        client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url,
+                                    max_retries=0, http_client=_get_http_client())
+        clients[key] = client
+    return client
+
+
+async def close_clients():
+    """关闭当前事件循环上的共享连接池"""
+    loop = asyncio.get_running_loop()
+    _openai_clients.pop(loop, None)
+    client = _http_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
 # ===================== 通义千问 API =====================
-def generate_with_qwen(prompt: str, api_key: str) -> Optional[str]:
-    """使用通义千问API生成内容"""
+async def _generate_with_qwen_sdk(prompt: str, api_key: str, max_tokens: int) -> Optional[str]:
+    """通过 dashscope SDK 调用（未安装 httpx 时兜底，每次请求新建连接）"""
     try:
         import dashscope
-        from dashscope import Generation
+        from dashscope import AioGeneration
         
         dashscope.api_key = api_key
         
-        response = Generation.call(
-            model='qwen-max',  # 或 qwen-turbo, qwen-plus
+        response = await AioGeneration.call(
+            model=QWEN_MODEL,
             messages=[
-                {'role': 'system', 'content': '你是一位中国非物质文化遗产研究专家，熟悉各类非遗项目的历史渊源、技艺特点和文化价值。'},
+                {'role': 'system', 'content': SYSTEM_PROMPT},
                 {'role': 'user', 'content': prompt}
             ],
-            result_format='message'
+            result_format='message',
+            max_tokens=max_tokens,
+            request_timeout=_request_timeout(max_tokens)
         )
         
         if response.status_code == 200:
-            return response.output.choices[0].message.content
+            choice = response.output.choices[0]
+            if choice.finish_reason == 'length':
+                logger.warning(f"输出达到 {max_tokens} token 上限被截断")
+            return choice.message.content
+        elif response.status_code == 429:
+            raise RateLimitError(response.message)
         else:
             logger.error(f"通义千问API调用失败: {response.message}")
             return None
     except ImportError:
-        logger.error("请安装dashscope: pip install dashscope")
+        logger.error("请安装httpx或dashscope: pip install httpx 'dashscope>=1.20'")
         return None
+    except RETRYABLE_ERRORS:
+        raise
     except Exception as e:
         logger.error(f"通义千问API错误: {e}")
         return None
 
 
+async def generate_with_qwen(prompt: str, api_key: str,
+                             max_tokens: int = MAX_OUTPUT_TOKENS) -> Optional[str]:
+    """使用通义千问API生成内容（异步，复用连接池调用 DashScope REST 接口）"""
+    try:
+        client = _get_http_client()
+    except ImportError:
+        return await _generate_with_qwen_sdk(prompt, api_key, max_tokens)
+    
+    import httpx
+    
+    payload = {
+        'model': QWEN_MODEL,
+        'input': {
+            'messages': [
+                {'role': 'system', 'content': SYSTEM_PROMPT},
+                {'role': 'user', 'content': prompt}
+            ]
+        },
+        'parameters': {'result_format': 'message', 'max_tokens': max_tokens}
+    }
+    try:
+        response = await client.post(
+            DASHSCOPE_URL,
+            json=payload,
+            headers={'Authorization': f'Bearer {api_key}'},
+            timeout=_request_timeout(max_tokens)
+        )
+    except httpx.TimeoutException as e:
+        raise asyncio.TimeoutError(str(e)) from e
+    except httpx.HTTPError as e:
+        logger.error(f"通义千问API错误: {e}")
+        return None
+    
+    if response.status_code == 429:
+        raise RateLimitError(response.text)
+    try:
+        data = response.json()
+    except ValueError:
+        logger.error(f"通义千问API返回无法解析: {response.status_code}")
+        return None
+    if response.status_code != 200:
+        logger.error(f"通义千问API调用失败: {data.get('message', response.status_code)}")
+        return None
+    
+    choice = data['output']['choices'][0]
+    if choice.get('finish_reason') == 'length':
+        logger.warning(f"输出达到 {max_tokens} token 上限被截断")
+    return choice['message']['content']
+
+
 # ===================== OpenAI兼容API =====================
-def generate_with_openai_compatible(prompt: str, api_key: str, 
-                                     base_url: str = "https://api.openai.com/v1",
-                                     model: str = "gpt-3.5-turbo") -> Optional[str]:
-    """使用OpenAI兼容API生成内容（支持本地部署的模型）"""
+async def generate_with_openai_compatible(prompt: str, api_key: str, 
+                                           base_url: str = "https://api.openai.com/v1",
+                                           model: str = OPENAI_MODEL,
+                                           max_tokens: int = MAX_OUTPUT_TOKENS) -> Optional[str]:
+    """使用OpenAI兼容API生成内容（支持本地部署的模型，异步）"""
     try:
         import openai
         
-        client = openai.OpenAI(api_key=api_key, base_url=base_url)
+        client = _get_openai_client(api_key, base_url)
         
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=model,
             messages=[
-                {"role": "system", "content": "你是一位中国非物质文化遗产研究专家，熟悉各类非遗项目的历史渊源、技艺特点和文化价值。"},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=1000,
-            temperature=0.7
+            max_tokens=max_tokens,
+            temperature=0.7,
+            timeout=_request_timeout(max_tokens)
         )
         
-        return response.choices[0].message.content
+        choice = response.choices[0]
+        if choice.finish_reason == 'length':
+            logger.warning(f"输出达到 {max_tokens} token 上限被截断")
+        return choice.message.content
     except ImportError:
-        logger.error("请安装openai: pip install openai")
+        logger.error("请安装openai和httpx: pip install openai httpx")
         return None
+    except openai.RateLimitError as e:
+        raise RateLimitError(str(e))
+    except openai.APITimeoutError as e:
+        raise asyncio.TimeoutError(str(e)) from e
     except Exception as e:
         logger.error(f"OpenAI API错误: {e}")
         return None
 
 
-def generate_ich_introduction(name: str, category: str, region: str, 
-                               organization: str, api_key: str,
-                               api_type: str = "qwen") -> Optional[str]:
+INTRO_ASPECTS = """请从以下几个方面进行介绍：
+1. 历史渊源：项目的起源、发展历程
+2. 技艺特点：主要表现形式、核心技艺
+3. 文化价值：承载的文化内涵、历史意义
+4. 传承现状：保护与传承情况
+5. 代表性特征：与其他同类项目的区别
+
+要求：
+- 语言准确、专业
+- 突出地域特色
+- 体现文化自信
+- 内容真实可信"""
+
+# 多项合并请求的分隔标记，如 ===ITEM 1===
+ITEM_MARK_RE = re.compile(r'===\s*ITEM\s*(\d+)\s*===')
+
+# 单次请求合并的项目数上限，过大时生成质量明显下降
+MAX_ITEMS_PER_CALL = 8
+
+# 输入CSV中用到的列；项目在流水线中以同顺序的 (名称, 类别, 申报地区, 保护单位) 元组传递
+PROJECT_COLUMNS = ('名称', '类别', '申报地区', '保护单位')
+
+
+# api_type → (生成函数, 模型名)
+GENERATORS = {
+    'qwen': (generate_with_qwen, QWEN_MODEL),
+    'openai': (generate_with_openai_compatible, OPENAI_MODEL),
+}
+
+
+def _get_generator(api_type: str):
+    if api_type in GENERATORS:
+        return GENERATORS[api_type][0]
+    logger.error(f"不支持的API类型: {api_type}")
+    return None
+
+
+def _cache_key(project: Tuple[str, str, str, str], api_type: str) -> str:
+    return LLMCache.make_key(GENERATORS[api_type][1], *project)
+
+
+async def _call_generator(generate, prompt: str, api_key: str,
+                          limiter: Optional[RateLimiter], max_tokens: int) -> Optional[str]:
+    if limiter is not None:
+        return await limiter.call(generate, prompt, api_key, max_tokens=max_tokens)
+    try:
+        return await generate(prompt, api_key, max_tokens=max_tokens)
+    except RETRYABLE_ERRORS as e:
+        logger.error(f"接口限流或超时: {e!r}")
+        return None
+
+
+async def generate_ich_introduction(name: str, category: str, region: str, 
+                                     organization: str, api_key: str,
+                                     api_type: str = "qwen",
+                                     limiter: RateLimiter = None,
+                                     cache: LLMCache = None) -> Optional[str]:
     """
     生成非遗项目详细介绍
     
@@ -97,6 +415,8 @@ def generate_ich_introduction(name: str, category: str, region: str,
         organization: 保护单位
         api_key: API密钥
         api_type: API类型 (qwen/openai)
+        limiter: 限速器，为空时不限速、不重试
+        cache: 结果缓存，为空时不缓存
     
     Returns:
         生成的项目介绍
@@ -108,108 +428,328 @@ def generate_ich_introduction(name: str, category: str, region: str,
 申报地区：{region}
 保护单位：{organization}
 
-请从以下几个方面进行介绍：
-1. 历史渊源：项目的起源、发展历程
-2. 技艺特点：主要表现形式、核心技艺
-3. 文化价值：承载的文化内涵、历史意义
-4. 传承现状：保护与传承情况
-5. 代表性特征：与其他同类项目的区别
-
-要求：
-- 语言准确、专业
-- 突出地域特色
-- 体现文化自信
-- 内容真实可信"""
+{INTRO_ASPECTS}"""
 
-    if api_type == "qwen":
-        return generate_with_qwen(prompt, api_key)
-    elif api_type == "openai":
-        return generate_with_openai_compatible(prompt, api_key)
-    else:
-        logger.error(f"不支持的API类型: {api_type}")
+    generate = _get_generator(api_type)
+    if generate is None:
         return None
+    
+    if cache is not None:
+        key = _cache_key((name, category, region, organization), api_type)
+        intro = cache.get(key)
+        if intro is not None:
+            return intro
+    
+    intro = await _call_generator(generate, prompt, api_key, limiter, MAX_OUTPUT_TOKENS)
+    if intro and cache is not None:
+        cache.put(key, GENERATORS[api_type][1], intro)
+    return intro
+
+
+def _parse_marshaled(text: str, count: int) -> List[Optional[str]]:
+    """按 ===ITEM i=== 切分合并回答，缺失或为空的项返回 None"""
+    intros: List[Optional[str]] = [None] * count
+    parts = ITEM_MARK_RE.split(text)
+    # split 结果形如 [前言, '1', 正文1, '2', 正文2, ...]
+    for num, body in zip(parts[1::2], parts[2::2]):
+        idx = int(num) - 1
+        body = body.strip()
+        if 0 <= idx < count and body and intros[idx] is None:
+            intros[idx] = body
+    return intros
+
+
+def _generate_one(project: Tuple[str, str, str, str], api_key: str, api_type: str,
+                  limiter: Optional[RateLimiter], cache: Optional[LLMCache]):
+    return generate_ich_introduction(*project, api_key, api_type, limiter, cache)
+
+
+async def generate_ich_introductions_batch(projects: List[Tuple[str, str, str, str]], api_key: str,
+                                           api_type: str = "qwen",
+                                           limiter: RateLimiter = None,
+                                           cache: LLMCache = None) -> List[Optional[str]]:
+    """
+    一次请求为多个项目生成介绍（行合并），摊薄每次请求的网络与排队开销
+    
+    Args:
+        projects: (名称, 类别, 申报地区, 保护单位) 元组，建议 3-5 个，最多 MAX_ITEMS_PER_CALL 个
+        cache: 结果缓存，命中的项目不再请求
+    
+    Returns:
+        与 projects 一一对应的介绍；合并回答中缺失或解析失败的项会单独重新生成，
+        合并请求本身失败时整组为 None
+    """
+    generate = _get_generator(api_type)
+    if generate is None:
+        return [None] * len(projects)
+    
+    intros: List[Optional[str]] = [None] * len(projects)
+    if cache is not None:
+        intros = [cache.get(_cache_key(p, api_type)) for p in projects]
+    pending = [i for i, intro in enumerate(intros) if intro is None]
+    if not pending:
+        return intros
+    if len(pending) == 1:
+        intros[pending[0]] = await _generate_one(projects[pending[0]], api_key, api_type, limiter, cache)
+        return intros
+    
+    k = len(pending)
+    items = '\n\n'.join(
+        f"{n}. 项目名称：{name}\n   类别：{category}\n"
+        f"   申报地区：{region}\n   保护单位：{organization}"
+        for n, (name, category, region, organization) in enumerate((projects[i] for i in pending), 1)
+    )
+    prompt = f"""请为以下{k}个国家级非物质文化遗产项目分别撰写一段详细介绍（每个约300-500字）。
+每个项目的介绍前单独一行写分隔标记 ===ITEM 序号===（如 ===ITEM 1===），按序号顺序输出，不要输出其他内容。
+
+{items}
+
+{INTRO_ASPECTS}"""
+    
+    text = await _call_generator(generate, prompt, api_key, limiter, MAX_OUTPUT_TOKENS * k)
+    if text is None:
+        # 请求本身失败（如重试耗尽）：整组记为失败，不拆成 k 个单项请求放大限流压力
+        logger.warning(f"合并请求失败，本组 {k} 项均未生成")
+        return intros
+    for i, intro in zip(pending, _parse_marshaled(text, k)):
+        intros[i] = intro
+        if intro and cache is not None:
+            cache.put(_cache_key(projects[i], api_type), GENERATORS[api_type][1], intro)
+    
+    # 解析失败的项退回单项生成
+    missing = [i for i in pending if intros[i] is None]
+    if missing:
+        logger.warning(f"合并请求中 {len(missing)}/{k} 项解析失败，改为单独生成")
+        retried = await asyncio.gather(*[
+            _generate_one(projects[i], api_key, api_type, limiter, cache) for i in missing
+        ])
+        for i, intro in zip(missing, retried):
+            intros[i] = intro
+    return intros
+
+
+# ===================== 结果文件（JSONL） =====================
+def _load_generated_names(jsonl_path: str) -> set:
+    """逐行读取已有 JSONL 结果，只保留项目名称"""
+    names = set()
+    if not os.path.exists(jsonl_path):
+        return names
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                names.add(json.loads(line)['项目名称'])
+            except (ValueError, KeyError):
+                # 中断时写了一半的末行
+                continue
+    return names
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def _is_json_array(path: str) -> bool:
+    """文件首个非空白字符为 '[' 时视为旧的 JSON 数组结果"""
+    if not os.path.exists(path):
+        return False
+    with open(path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return False
+            stripped = chunk.lstrip()
+            if stripped:
+                return stripped[0] == '['
+
+
+def json_to_jsonl(json_path: str, jsonl_path: str):
+    """把旧的 JSON 数组结果转为 JSONL（一次性迁移）"""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    with open(jsonl_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    logger.info(f"已迁移 {len(records)} 条结果至 {jsonl_path}")
+
+
+def finalize_jsonl_to_json(in_path: str, out_path: str) -> int:
+    """把 JSONL 结果汇总为 JSON 数组，供仍读取 JSON 的下游使用（如 build_vector_index.py）"""
+    records = []
+    with open(in_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+    logger.info(f"已汇总 {len(records)} 条结果至 {out_path}")
+    return len(records)
+
+
+def _iter_new_projects(csv_path: str, generated_names: set, limit: int = None):
+    """
+    逐行读取CSV，跳过重复和已生成的项目（惰性生成，不在内存中保留全部行）
+
+    Yields:
+        (名称, 类别, 申报地区, 保护单位) 元组
+    """
+    seen_names = set()
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        # csv.reader + 列下标比 DictReader 逐行建 dict 快约一倍
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        if PROJECT_COLUMNS[0] not in header:
+            raise ValueError(f"CSV 缺少必需的列: {PROJECT_COLUMNS[0]}")
+        width = len(header)
+        name_i = header.index(PROJECT_COLUMNS[0])
+        # 可选列缺失时取空值，与 DictReader 一致
+        cat_i, reg_i, org_i = (header.index(col) if col in header else None for col in PROJECT_COLUMNS[1:])
+        for row in reader:
+            if len(row) < width:
+                # 缺列的行按空值补齐（同 DictReader）
+                row += [''] * (width - len(row))
+            name = row[name_i]
+            if name and name not in seen_names and name not in generated_names:
+                seen_names.add(name)
+                yield (name,
+                       row[cat_i] if cat_i is not None else '',
+                       row[reg_i] if reg_i is not None else '',
+                       row[org_i] if org_i is not None else '')
+                if limit and len(seen_names) >= limit:
+                    return
+
+
+async def _produce(projects, queue: asyncio.Queue, items_per_call: int):
+    """按 items_per_call 分组放入队列，队列满时等待消费者；结束时放入 None 哨兵"""
+    while True:
+        group = list(itertools.islice(projects, items_per_call))
+        if not group:
+            break
+        await queue.put(group)
+    await queue.put(None)
+
+
+async def _batch_generate_async(projects, out_f, 
+                                api_key: str, api_type: str,
+                                max_concurrency: int, limiter: RateLimiter,
+                                items_per_call: int, cache: Optional[LLMCache]):
+    """
+    并发生成：生产者边读CSV边分组入队，max_concurrency 个消费者并发请求，
+    令牌桶控制速率，每条结果生成后立即追加写入 out_f
+
+    Returns:
+        成功生成的条数
+    """
+    queue = asyncio.Queue(maxsize=max_concurrency * 2)
+    state = {'done': 0, 'generated': 0}
+    
+    async def _worker():
+        while True:
+            group = await queue.get()
+            if group is None:
+                # 哨兵传给下一个消费者
+                await queue.put(None)
+                return
+            
+            intros = await generate_ich_introductions_batch(group, api_key, api_type, limiter, cache)
+            for (name, category, region, organization), intro in zip(group, intros):
+                state['done'] += 1
+                
+                if intro:
+                    record = {
+                        '项目名称': name,
+                        '类别': category,
+                        '申报地区': region,
+                        '保护单位': organization,
+                        '详细介绍': intro,
+                        '生成方式': f'AI生成 ({api_type})'
+                    }
+                    # 逐条追加并落盘：写入代价与已有结果数无关，中断也不丢已生成的内容
+                    out_f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    out_f.flush()
+                    os.fsync(out_f.fileno())
+                    state['generated'] += 1
+                    logger.info(f"[{state['done']}] ✓ {name} 生成成功，长度: {len(intro)}")
+                else:
+                    logger.warning(f"[{state['done']}] ✗ {name} 生成失败")
+    
+    try:
+        await asyncio.gather(
+            _produce(projects, queue, items_per_call),
+            *[_worker() for _ in range(max_concurrency)]
+        )
+    finally:
+        await close_clients()
+    return state['generated']
 
 
 def batch_generate_introductions(csv_path: str, output_path: str, 
                                   api_key: str, api_type: str = "qwen",
-                                  limit: int = None, delay: float = 1.0):
+                                  limit: int = None, max_concurrency: int = 8,
+                                  rpm: float = 60, tpm: float = 100000,
+                                  items_per_call: int = 4, cache_path: str = None):
     """
     批量生成非遗项目介绍
     
     Args:
         csv_path: 输入CSV文件路径
-        output_path: 输出JSON文件路径
+        output_path: 输出JSONL文件路径（每行一条结果，追加写入），不存在时从同名 .json 结果迁移；
+            若为旧的 JSON 数组文件，则在同名 .jsonl 中续写，结束后汇总回该 JSON 文件
         api_key: API密钥
         api_type: API类型
         limit: 限制生成数量
-        delay: 请求间隔（秒）
+        max_concurrency: 同时在途的最大请求数
+        rpm: 每分钟请求数上限
+        tpm: 每分钟 token 数上限
+        items_per_call: 每次请求合并生成的项目数（1 为逐项生成，最多 MAX_ITEMS_PER_CALL）
+        cache_path: SQLite 结果缓存路径，为空时不缓存
     """
-    # 加载现有结果
-    results = []
-    if os.path.exists(output_path):
-        try:
-            with open(output_path, 'r', encoding='utf-8') as f:
-                results = json.load(f)
-            logger.info(f"加载已有结果 {len(results)} 条")
-        except:
-            pass
+    # 兼容旧调用方式：传入 JSON 数组结果时不能直接追加 JSONL，改为在同名 .jsonl 中续写
+    json_path = None
+    if _is_json_array(output_path):
+        json_path = output_path
+        output_path = os.path.splitext(json_path)[0] + '.jsonl'
+        logger.info(f"{json_path} 为 JSON 数组，结果写入 {output_path}")
     
-    generated_names = set(r.get('项目名称', '') for r in results)
+    # 首次使用 JSONL 时从同名的旧 JSON 结果迁移，避免重复生成
+    legacy_path = json_path or os.path.splitext(output_path)[0] + '.json'
+    if not os.path.exists(output_path) and _is_json_array(legacy_path):
+        json_to_jsonl(legacy_path, output_path)
     
-    # 读取CSV
-    projects = []
-    seen_names = set()
-    with open(csv_path, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            name = row.get('名称', '')
-            if name and name not in seen_names and name not in generated_names:
-                seen_names.add(name)
-                projects.append(row)
+    # 加载已生成的项目名
+    generated_names = _load_generated_names(output_path)
+    if generated_names:
+        logger.info(f"加载已有结果 {len(generated_names)} 条")
     
-    if limit:
-        projects = projects[:limit]
+    # 读取CSV：边读边生成，不预先载入全部行
+    projects = _iter_new_projects(csv_path, generated_names, limit)
     
-    logger.info(f"待生成项目数: {len(projects)}")
+    items_per_call = max(1, min(items_per_call, MAX_ITEMS_PER_CALL))
+    logger.info(f"开始生成，并发数: {max_concurrency}，每次请求 {items_per_call} 项")
     
-    for i, project in enumerate(projects):
-        name = project.get('名称', '')
-        category = project.get('类别', '')
-        region = project.get('申报地区', '')
-        organization = project.get('保护单位', '')
-        
-        logger.info(f"[{i+1}/{len(projects)}] 生成: {name}")
-        
-        intro = generate_ich_introduction(
-            name, category, region, organization,
-            api_key, api_type
-        )
-        
-        if intro:
-            results.append({
-                '项目名称': name,
-                '类别': category,
-                '申报地区': region,
-                '保护单位': organization,
-                '详细介绍': intro,
-                '生成方式': f'AI生成 ({api_type})'
-            })
-            logger.info(f"  ✓ 生成成功，长度: {len(intro)}")
-            
-            # 定期保存
-            if len(results) % 10 == 0:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    json.dump(results, f, ensure_ascii=False, indent=2)
-        else:
-            logger.warning(f"  ✗ 生成失败")
-        
-        time.sleep(delay)
-    
-    # 最终保存
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    cache = LLMCache(cache_path) if cache_path else None
+    try:
+        with open(output_path, 'a', encoding='utf-8') as out_f:
+            if out_f.tell() and not _ends_with_newline(output_path):
+                # 上次中断留下的半行单独成行，不与新记录粘连
+                out_f.write('\n')
+            generated = asyncio.run(_batch_generate_async(
+                projects, out_f,
+                api_key, api_type, max_concurrency, RateLimiter(rpm=rpm, tpm=tpm),
+                items_per_call, cache
+            ))
+    finally:
+        if cache is not None:
+            cache.close()
     
-    logger.info(f"完成！共生成 {len(results)} 条项目介绍")
+    if json_path:
+        finalize_jsonl_to_json(output_path, json_path)
+    logger.info(f"完成！本次生成 {generated} 条项目介绍")
 
 
 def main():
@@ -223,7 +763,9 @@ def main():
         return
     
     csv_path = 'ich_national_full_data.csv'
-    output_path = 'ich_ai_introductions.json'
+    output_path = 'ich_ai_introductions.jsonl'
+    # build_vector_index.py 读取的 JSON 数组
+    json_path = 'ich_ai_introductions.json'
     
     # 先测试生成5个
     batch_generate_introductions(
@@ -231,8 +773,15 @@ def main():
         api_key=api_key,
         api_type='qwen',
         limit=5,
-        delay=1.5
+        max_concurrency=int(os.getenv('ICH_GEN_CONCURRENCY', 8)),
+        rpm=float(os.getenv('ICH_GEN_RPM', 60)),
+        tpm=float(os.getenv('ICH_GEN_TPM', 100000)),
+        items_per_call=int(os.getenv('ICH_GEN_ITEMS_PER_CALL', 4)),
+        # 生成使用 temperature=0.7，默认不缓存；设置 ICH_GEN_CACHE 后复用已生成的结果
+        cache_path=os.getenv('ICH_GEN_CACHE') or None
     )
+    
+    finalize_jsonl_to_json(output_path, json_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn 配置
+
+使用方法:
+    gunicorn -c gunicorn_conf.py
+
+向量模型在主进程中预加载一次，fork 后各 worker 通过写时复制共享模型权重；
+Neo4j 驱动等连接类资源不能跨 fork 共享，在每个 worker 启动后各自初始化。
+"""
+
+import os
+import multiprocessing
+
+wsgi_app = 'app:app'
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+# 大模型接口以网络等待为主，多进程 × 多线程提升并发
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# 大模型生成（含流式输出）可能持续数十秒
+timeout = 120
+keepalive = 5
+
+preload_app = True
+
+
+def on_starting(server):
+    """主进程启动时加载向量模型"""
+    try:
+        from rag_engine import get_embedding_model
+        get_embedding_model()
+    except ImportError:
+        server.log.warning("未安装 sentence-transformers，跳过向量模型预加载")
+
+
+def post_fork(server, worker):
+    """每个 worker 建立自己的 Neo4j 连接池并加载索引"""
+    from app import init_engines
+    init_engines()
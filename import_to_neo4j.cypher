@@ -33,6 +33,9 @@ CREATE INDEX item_id_index IF NOT EXISTS FOR (i:Item) ON (i.id);
 CREATE INDEX category_name_index IF NOT EXISTS FOR (c:Category) ON (c.name);
 CREATE INDEX region_name_index IF NOT EXISTS FOR (r:Region) ON (r.name);
 CREATE INDEX org_name_index IF NOT EXISTS FOR (o:Organization) ON (o.name);
+// 全文索引：支持名称/地区的子串检索（rag_engine 以短语查询使用，缺失时退回 CONTAINS 扫描）
+CREATE FULLTEXT INDEX item_name_ft IF NOT EXISTS FOR (i:Item) ON EACH [i.name, i.名称];
+CREATE FULLTEXT INDEX region_name_ft IF NOT EXISTS FOR (r:Region) ON EACH [r.name];
 
 // 3. 导入数据（简化版，不使用 IN TRANSACTIONS）
 LOAD CSV WITH HEADERS FROM 'file:///ich_national_full_data.csv' AS row
@@ -11,38 +11,334 @@
 """
 
 import os
+import re
 import json
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Tuple
-from neo4j import GraphDatabase
+from neo4j import GraphDatabase, READ_ACCESS
+from neo4j.exceptions import ClientError
+from cachetools import TTLCache, cachedmethod
+from semantic_cache import SemanticCache
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 按类别/地区查询的结果缓存时间（秒），热门类别和省份被反复查询
+KG_QUERY_CACHE_TTL = int(os.getenv('KG_QUERY_CACHE_TTL', 300))
+
+# 检索结果缓存：相同（忽略首尾空白和大小写）或向量相似度 ≥ 阈值的查询直接复用检索结果
+RETRIEVAL_CACHE_TTL = int(os.getenv('RETRIEVAL_CACHE_TTL', 600))
+RETRIEVAL_CACHE_THRESHOLD = float(os.getenv('RETRIEVAL_CACHE_THRESHOLD', 0.97))
+
+# 中文嵌入模型
+EMBEDDING_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+
+# 推理后端：torch（默认）或 onnx（ONNX Runtime + int8 动态量化，CPU 上查询编码明显更快）
+# onnx 需 sentence-transformers[onnx]>=3.2，模型文件取自模型仓库 onnx/ 目录下的量化导出
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_ONNX_FILE = os.getenv('EMBEDDING_ONNX_FILE', 'onnx/model_qint8_avx512_vnni.onnx')
+
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+# 问答提示词模板：静态说明在前、检索内容和用户问题在后，保持前缀稳定以命中前缀缓存
+ANSWER_PROMPT_TPL = """你是一位中国非物质文化遗产专家，请根据以下参考信息回答用户问题。请给出准确、专业的回答，如果参考信息不足，请诚实说明。
+
+参考信息：
+{context}
+
+用户问题：{query}"""
+
+
+# FAISS 索引类型按文档规模选择：小库 int8 标量量化扫描，中等规模 HNSW 图索引，大库 IVF-PQ
+FLAT_INDEX_MAX_DOCS = 2000
+HNSW_INDEX_MAX_DOCS = 50000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 16
+PQ_M = 32
+# 量化索引先取 top_k * RERANK_FACTOR 个候选，再用原始向量精确打分重排
+RERANK_FACTOR = 2
+
+
+def _create_faiss_index(embeddings):
+    """根据向量数量创建并填充内积索引（向量须已归一化）"""
+    import faiss
+    
+    n, dimension = embeddings.shape
+    if n < FLAT_INDEX_MAX_DOCS:
+        # 每维 1 字节（FP32 的 1/4），按各维取值范围训练量化区间
+        index = faiss.IndexScalarQuantizer(
+            dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(embeddings)
+    elif n <= HNSW_INDEX_MAX_DOCS:
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    else:
+        nlist = int(n ** 0.5)
+        # PQ 子空间数须整除向量维度
+        m = PQ_M if dimension % PQ_M == 0 else 1
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    index.add(embeddings)
+    _tune_faiss_index(index)
+    return index
+
+
+# 有 CUDA 且安装了 faiss-gpu 时把检索索引放到 GPU（FAISS_USE_GPU=0 关闭）
+FAISS_USE_GPU = os.getenv('FAISS_USE_GPU', '1') != '0'
+
+_gpu_resources = None
+
+
+def _index_to_gpu(index):
+    """尽量把索引复制到 GPU 0，不支持（无 GPU、CPU 版 faiss、索引类型无 GPU 实现）时原样返回"""
+    global _gpu_resources
+    import faiss
+    
+    if not FAISS_USE_GPU or not hasattr(faiss, 'StandardGpuResources') or faiss.get_num_gpus() == 0:
+        return index
+    try:
+        if _gpu_resources is None:
+            _gpu_resources = faiss.StandardGpuResources()
+        gpu_index = faiss.index_cpu_to_gpu(_gpu_resources, 0, index)
+        logger.info(f"FAISS 索引已移至 GPU（{type(index).__name__}）")
+        return gpu_index
+    except Exception as e:
+        logger.info(f"FAISS 索引保留在 CPU: {e}")
+        return index
+
+
+def _tune_faiss_index(index):
+    """设置查询期参数（读盘后也需重新设置）"""
+    import faiss
+    
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = IVF_NPROBE
+
+
+# 类别关键词映射
+CATEGORY_KEYWORDS = {
+    '民间文学': ('传说', '故事', '歌谣', '史诗', '神话', '谚语', '童谣'),
+    '传统音乐': ('音乐', '民歌', '号子', '曲艺', '器乐', '古琴', '唢呐'),
+    '传统舞蹈': ('舞蹈', '龙舞', '狮舞', '秧歌', '傩舞', '花鼓'),
+    '传统戏剧': ('戏剧', '京剧', '昆曲', '越剧', '皮影戏', '木偶'),
+    '曲艺': ('曲艺', '相声', '评书', '大鼓', '快板'),
+    '传统美术': ('美术', '剪纸', '年画', '刺绣', '雕刻', '泥塑'),
+    '传统技艺': ('技艺', '织造', '酿造', '制茶', '制瓷', '铸造'),
+    '传统医药': ('医药', '中医', '针灸', '推拿', '药物'),
+    '民俗': ('民俗', '节日', '习俗', '祭祀', '婚俗'),
+}
+
+# 省份（地区查询）
+PROVINCES = ('北京', '天津', '河北', '山西', '内蒙古', '辽宁', '吉林', '黑龙江',
+             '上海', '江苏', '浙江', '安徽', '福建', '江西', '山东', '河南',
+             '湖北', '湖南', '广东', '广西', '海南', '重庆', '四川', '贵州',
+             '云南', '西藏', '陕西', '甘肃', '青海', '宁夏', '新疆')
+
+
+def _compile_intent_matcher(category_keywords: Dict, provinces: tuple):
+    """
+    把类别名、类别关键词和省份编译成一个正则，一次扫描完成意图识别
+    
+    优先级与逐个检查时一致：按类别顺序，类别优先于地区；关键词重复时以先出现的为准
+    """
+    targets = {}
+    for category, keywords in category_keywords.items():
+        for kw in (category,) + keywords:
+            targets.setdefault(kw, (len(targets), 'category', category))
+    for province in provinces:
+        targets.setdefault(province, (len(targets), 'region', province))
+    
+    # 零宽前瞻可在每个位置匹配（含重叠的关键词）；同一位置按优先级顺序尝试
+    alternatives = sorted(targets, key=lambda kw: targets[kw][0])
+    pattern = re.compile('(?=(' + '|'.join(map(re.escape, alternatives)) + '))')
+    return pattern, targets
+
+
+_INTENT_RE, _INTENT_TARGETS = _compile_intent_matcher(CATEGORY_KEYWORDS, PROVINCES)
+
+
+@functools.lru_cache(maxsize=10000)
+def _match_intent(query: str) -> Tuple[str, str]:
+    """返回 (意图类型, 关键词)，结果按查询文本缓存"""
+    best = None
+    for m in _INTENT_RE.finditer(query):
+        target = _INTENT_TARGETS[m.group(1)]
+        if best is None or target[0] < best[0]:
+            best = target
+    if best is None:
+        return 'name', query
+    return best[1], best[2]
+
+
+def _as_query_vector(embedding):
+    """整理为 (1, d) 的 float32 查询向量（编码时已归一化，不再重复 normalize_L2）"""
+    import numpy as np
+    return np.asarray(embedding, dtype='float32').reshape(1, -1)
+
+
+def get_embedding_model():
+    """
+    获取进程内共享的向量模型（单例）
+    
+    向量检索与语义缓存共用同一个模型，避免重复加载
+    
+    Returns:
+        SentenceTransformer 实例；未安装依赖时返回 None
+    """
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                from sentence_transformers import SentenceTransformer
+                if EMBEDDING_BACKEND == 'onnx':
+                    try:
+                        _embedding_model = SentenceTransformer(
+                            EMBEDDING_MODEL_NAME, backend='onnx',
+                            model_kwargs={'file_name': EMBEDDING_ONNX_FILE}
+                        )
+                        logger.info(f"向量模型加载成功（ONNX: {EMBEDDING_ONNX_FILE}）")
+                    except Exception as e:
+                        logger.warning(f"ONNX 向量模型加载失败，改用 PyTorch: {e}")
+                if _embedding_model is None:
+                    _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+                    logger.info("向量模型加载成功")
+    return _embedding_model
+
+
+class EmbedBatcher:
+    """
+    查询向量批量编码器
+    
+    并发请求的单条编码先进入队列，最多等待 max_wait 秒或凑满 max_batch 条后
+    合并成一次 model.encode 调用。必须始终在同一个事件循环中使用。
+    """
+    
+    def __init__(self, max_batch: int = 32, max_wait: float = 0.01):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = None
+        self._task = None
+    
+    async def encode(self, text: str):
+        """编码单条文本，返回 L2 归一化的一维向量"""
+        loop = asyncio.get_running_loop()
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        
+        future = loop.create_future()
+        await self._queue.put((text, future))
+        return await future
+    
+    def _encode_batch(self, texts: List[str]):
+        return get_embedding_model().encode(
+            texts, batch_size=self.max_batch, convert_to_numpy=True, normalize_embeddings=True
+        )
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(items) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            texts = [text for text, _ in items]
+            try:
+                # 模型加载与推理都是阻塞操作，放到线程中避免阻塞事件循环
+                vectors = await asyncio.to_thread(self._encode_batch, texts)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), vector in zip(items, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
 
 class Neo4jKnowledgeGraph:
     """Neo4j知识图谱查询引擎"""
     
     def __init__(self, uri: str = "bolt://localhost:7687", 
-                 user: str = "neo4j", password: str = "password"):
+                 user: str = "neo4j", password: str = "password",
+                 database: str = "neo4j", max_connection_pool_size: int = 100):
         """初始化Neo4j连接"""
         self.driver = None
+        self.database = database
+        self._fulltext_available = True
+        # 类别/地区查询结果缓存（按实例持有，随实例释放）
+        self._category_cache = TTLCache(maxsize=512, ttl=KG_QUERY_CACHE_TTL)
+        self._region_cache = TTLCache(maxsize=512, ttl=KG_QUERY_CACHE_TTL)
+        self._query_cache_lock = threading.Lock()
         try:
-            self.driver = GraphDatabase.driver(uri, auth=(user, password))
-            # 测试连接
-            with self.driver.session() as session:
-                session.run("RETURN 1")
+            self.driver = GraphDatabase.driver(
+                uri, auth=(user, password),
+                max_connection_pool_size=max_connection_pool_size,
+                connection_acquisition_timeout=30,
+                max_connection_lifetime=3600,
+                # 空闲超过 30 秒的连接取用前先探活，避免拿到已被服务端/防火墙断开的冷连接
+                liveness_check_timeout=30
+            )
+            # 测试连接，同时预热连接池
+            self.driver.verify_connectivity()
             logger.info("Neo4j连接成功")
         except Exception as e:
             logger.error(f"Neo4j连接失败: {e}")
     
+    def session(self, **kwargs):
+        """打开只读会话，显式指定数据库以省去每次的默认库路由查询"""
+        return self.driver.session(database=self.database, default_access_mode=READ_ACCESS, **kwargs)
+    
+    def read(self, query: str, **params) -> list:
+        """
+        在托管读事务中执行查询
+        
+        集群部署时读请求可路由到从节点；遇到瞬时错误由驱动自动重试
+        
+        Returns:
+            Record 列表
+        """
+        with self.session() as session:
+            return session.execute_read(lambda tx: list(tx.run(query, **params)))
+    
     def close(self):
         if self.driver:
             self.driver.close()
     
-    def query_by_name(self, name: str) -> List[Dict]:
-        """根据名称查询非遗项目"""
-        query = """
+    # 名称/地区子串查询：优先走全文索引（见 import_to_neo4j.cypher），索引不存在时退回 CONTAINS 全标签扫描
+    ITEM_BY_NAME_FT = """
+        CALL db.index.fulltext.queryNodes('item_name_ft', $phrase) YIELD node AS item, score
+        WITH item ORDER BY score DESC LIMIT 10
+        OPTIONAL MATCH (item)-[:属于]->(category:Category)
+        OPTIONAL MATCH (item)-[:申报于]->(region:Region)
+        OPTIONAL MATCH (item)-[:由保护单位]->(org:Organization)
+        RETURN item.name AS 名称,
+               category.name AS 类别,
+               region.name AS 申报地区,
+               org.name AS 保护单位
+        LIMIT 10
+        """
+    ITEM_BY_NAME_SCAN = """
         MATCH (item:Item)
         WHERE item.name CONTAINS $name OR item.名称 CONTAINS $name
         OPTIONAL MATCH (item)-[:属于]->(category:Category)
@@ -54,51 +350,89 @@ class Neo4jKnowledgeGraph:
                org.name AS 保护单位
         LIMIT 10
         """
-        with self.driver.session() as session:
-            result = session.run(query, name=name)
-            return [dict(record) for record in result]
+    ITEM_BY_REGION_FT = """
+        CALL db.index.fulltext.queryNodes('region_name_ft', $phrase) YIELD node AS r
+        MATCH (r)<-[:申报于]-(item:Item)
+        OPTIONAL MATCH (item)-[:属于]->(category:Category)
+        RETURN item.name AS 名称, category.name AS 类别, r.name AS 申报地区
+        LIMIT 20
+        """
+    ITEM_BY_REGION_SCAN = """
+        MATCH (r:Region)
+        WHERE r.name CONTAINS $region
+        MATCH (r)<-[:申报于]-(item:Item)
+        OPTIONAL MATCH (item)-[:属于]->(category:Category)
+        RETURN item.name AS 名称, category.name AS 类别, r.name AS 申报地区
+        LIMIT 20
+        """
+    
+    @staticmethod
+    def _lucene_phrase(text: str) -> str:
+        """
+        转成 Lucene 短语查询
+        
+        标准分词器把中文切成单字，短语查询要求单字连续出现，效果等同子串匹配
+        """
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    
+    def _read_fulltext(self, fulltext_query: str, scan_query: str, text: str, **params) -> list:
+        """
+        执行全文索引查询，失败时改用扫描查询
+        
+        仅在索引不存在时记录一次警告并停用全文查询；其他错误（如个别输入无法解析）只影响本次查询
+        """
+        # 空白输入会变成空短语，交给扫描查询处理
+        if self._fulltext_available and text.strip():
+            try:
+                return self.read(fulltext_query, phrase=self._lucene_phrase(text))
+            except ClientError as e:
+                if 'no such fulltext schema index' in str(e).lower():
+                    self._fulltext_available = False
+                    logger.warning(f"全文索引不存在，改用 CONTAINS 查询（请执行 import_to_neo4j.cypher 中的建索引语句）: {e}")
+                else:
+                    logger.warning(f"全文索引查询失败，本次改用 CONTAINS 查询: {e}")
+        return self.read(scan_query, **params)
+    
+    def query_by_name(self, name: str) -> List[Dict]:
+        """根据名称查询非遗项目"""
+        records = self._read_fulltext(self.ITEM_BY_NAME_FT, self.ITEM_BY_NAME_SCAN, name, name=name)
+        return [dict(record) for record in records]
     
     def query_by_category(self, category: str) -> List[Dict]:
         """根据类别查询非遗项目"""
+        return list(self._query_by_category(category))
+    
+    @cachedmethod(lambda self: self._category_cache, lock=lambda self: self._query_cache_lock)
+    def _query_by_category(self, category: str) -> tuple:
         query = """
         MATCH (c:Category {name: $category})<-[:属于]-(item:Item)
         OPTIONAL MATCH (item)-[:申报于]->(region:Region)
         RETURN item.name AS 名称, region.name AS 申报地区
         LIMIT 20
         """
-        with self.driver.session() as session:
-            result = session.run(query, category=category)
-            return [dict(record) for record in result]
+        return tuple(dict(record) for record in self.read(query, category=category))
     
     def query_by_region(self, region: str) -> List[Dict]:
         """根据地区查询非遗项目"""
-        query = """
-        MATCH (r:Region)
-        WHERE r.name CONTAINS $region
-        MATCH (r)<-[:申报于]-(item:Item)
-        OPTIONAL MATCH (item)-[:属于]->(category:Category)
-        RETURN item.name AS 名称, category.name AS 类别, r.name AS 申报地区
-        LIMIT 20
-        """
-        with self.driver.session() as session:
-            result = session.run(query, region=region)
-            return [dict(record) for record in result]
+        return list(self._query_by_region(region))
+    
+    @cachedmethod(lambda self: self._region_cache, lock=lambda self: self._query_cache_lock)
+    def _query_by_region(self, region: str) -> tuple:
+        records = self._read_fulltext(self.ITEM_BY_REGION_FT, self.ITEM_BY_REGION_SCAN, region, region=region)
+        return tuple(dict(record) for record in records)
     
     def get_statistics(self) -> Dict:
         """获取知识图谱统计信息"""
-        queries = {
-            'total_items': "MATCH (i:Item) RETURN count(i) AS count",
-            'total_categories': "MATCH (c:Category) RETURN count(c) AS count",
-            'total_regions': "MATCH (r:Region) RETURN count(r) AS count",
-            'total_orgs': "MATCH (o:Organization) RETURN count(o) AS count",
-        }
-        
-        stats = {}
-        with self.driver.session() as session:
-            for key, query in queries.items():
-                result = session.run(query)
-                stats[key] = result.single()['count']
-        return stats
+        # 一次往返取回全部计数（各标签计数走计数存储，不扫描节点）；
+        # 每个计数放在独立子查询中，某个标签没有节点时也返回 0 而不是空结果
+        query = """
+        CALL { MATCH (i:Item) RETURN count(i) AS total_items }
+        CALL { MATCH (c:Category) RETURN count(c) AS total_categories }
+        CALL { MATCH (r:Region) RETURN count(r) AS total_regions }
+        CALL { MATCH (o:Organization) RETURN count(o) AS total_orgs }
+        RETURN total_items, total_categories, total_regions, total_orgs
+        """
+        return dict(self.read(query)[0])
     
     def get_category_distribution(self) -> List[Dict]:
         """获取各类别项目分布"""
@@ -107,9 +441,7 @@ class Neo4jKnowledgeGraph:
         RETURN c.name AS 类别, count(item) AS 数量
         ORDER BY 数量 DESC
         """
-        with self.driver.session() as session:
-            result = session.run(query)
-            return [dict(record) for record in result]
+        return [dict(record) for record in self.read(query)]
 
 
 class VectorRetriever:
@@ -120,36 +452,82 @@ class VectorRetriever:
         self.index = None
         self.documents = []
         self.embeddings_model = None
-        
-        try:
-            from sentence_transformers import SentenceTransformer
-            import faiss
-            
-            # 加载中文嵌入模型
-            self.embeddings_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-            logger.info("向量模型加载成功")
-            
-            if index_path and os.path.exists(index_path):
-                self._load_index(index_path)
-        except ImportError:
-            logger.warning("请安装依赖: pip install sentence-transformers faiss-cpu")
+        # 原始归一化向量（加载时为只读内存映射），用于候选精确重排；为空时不重排
+        self.embeddings = None
+        # 仅有损编码（标量量化、PQ）的索引需要重排；Flat/HNSWFlat 返回的已是 float32 精确内积
+        self._lossy = False
+        # 索引每次构建/加载后递增，上层据此让检索缓存失效
+        self.version = 0
+        
+        # faiss / sentence-transformers 导入即要数秒（加载 torch、MKL 等），
+        # 推迟到首次构建或检索时再加载，只用知识图谱功能时不付出这部分开销
+        self._index_path = index_path
+        self._model_loaded = False
+        self._load_lock = threading.Lock()
+    
+    def _ensure_loaded(self):
+        """首次使用时导入 faiss、加载嵌入模型并读取已有索引（线程安全，只执行一次）"""
+        if self._model_loaded:
+            return
+        with self._load_lock:
+            if self._model_loaded:
+                return
+            try:
+                import faiss
+                
+                # 加载中文嵌入模型（进程内共享，gunicorn 预加载时直接复用）
+                self.embeddings_model = get_embedding_model()
+                
+                if self._index_path and os.path.exists(self._index_path):
+                    self._load_index(self._index_path)
+            except ImportError as e:
+                logger.warning(f"向量检索不可用（{e}），请安装依赖: pip install sentence-transformers faiss-cpu")
+            except Exception as e:
+                # 索引文件损坏或不完整：标记向量检索不可用，不在每次请求时重试
+                logger.error(f"加载向量索引失败，向量检索不可用: {e}")
+                self.index = None
+                self.embeddings = None
+                self.documents = []
+            self._model_loaded = True
+    
+    def load(self) -> 'VectorRetriever':
+        """显式预加载模型与索引（如服务启动时预热），返回自身"""
+        self._ensure_loaded()
+        return self
     
     def _load_index(self, path: str):
         """加载已有索引"""
         import faiss
-        self.index = faiss.read_index(f"{path}/faiss.index")
+        index = faiss.read_index(f"{path}/faiss.index")
+        _tune_faiss_index(index)
+        self._set_index(index)
+        if os.path.exists(f"{path}/embeddings.npy"):
+            import numpy as np
+            self.embeddings = np.load(f"{path}/embeddings.npy", mmap_mode='r')
         with open(f"{path}/documents.json", 'r', encoding='utf-8') as f:
             self.documents = json.load(f)
+        self.version += 1
         logger.info(f"加载索引成功，文档数: {len(self.documents)}")
     
-    def build_index(self, documents: List[Dict], save_path: str = None):
+    def _set_index(self, index):
+        """启用 CPU 索引（可用时复制到 GPU 检索，search 无需改动）"""
+        import faiss
+        self._lossy = isinstance(index, (
+            faiss.IndexScalarQuantizer, faiss.IndexPQ,
+            faiss.IndexIVFScalarQuantizer, faiss.IndexIVFPQ
+        ))
+        self.index = _index_to_gpu(index)
+    
+    def build_index(self, documents: List[Dict], save_path: str = None, batch_size: int = 256):
         """
         构建向量索引
         
         Args:
             documents: 文档列表，每个文档包含 'title' 和 'content'
             save_path: 索引保存路径
+            batch_size: 编码批大小（GPU 上可适当调大）
         """
+        self._ensure_loaded()
         import faiss
         import numpy as np
         
@@ -159,58 +537,85 @@ class VectorRetriever:
         
         self.documents = documents
         
-        # 生成文档向量
+        # 生成文档向量（encode 内部已按文本长度排序分批以减少填充，并直接输出归一化向量）
         texts = [f"{d.get('title', '')} {d.get('content', '')}" for d in documents]
-        embeddings = self.embeddings_model.encode(texts, show_progress_bar=True)
-        embeddings = np.array(embeddings).astype('float32')
+        embeddings = self.embeddings_model.encode(
+            texts, batch_size=batch_size, convert_to_numpy=True,
+            normalize_embeddings=True, show_progress_bar=True
+        )
+        embeddings = np.asarray(embeddings, dtype='float32')
         
-        # 创建FAISS索引
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)  # 内积相似度
-        faiss.normalize_L2(embeddings)  # 归一化
-        self.index.add(embeddings)
+        # 创建FAISS索引（内积相似度，向量已归一化即余弦相似度）
+        index = _create_faiss_index(embeddings)
+        self._set_index(index)
+        self.embeddings = embeddings
+        self.version += 1
         
-        logger.info(f"索引构建完成，文档数: {len(documents)}")
+        logger.info(f"索引构建完成（{type(index).__name__}），文档数: {len(documents)}")
         
         # 保存索引
         if save_path:
             os.makedirs(save_path, exist_ok=True)
-            faiss.write_index(self.index, f"{save_path}/faiss.index")
+            # GPU 索引不能直接序列化，保存 CPU 版本
+            faiss.write_index(index, f"{save_path}/faiss.index")
+            # 归一化向量另存为 float16 .npy，可用 np.load(mmap_mode='r') 直接映射读取
+            np.save(f"{save_path}/embeddings.npy", embeddings.astype('float16'), allow_pickle=False)
             with open(f"{save_path}/documents.json", 'w', encoding='utf-8') as f:
                 json.dump(documents, f, ensure_ascii=False, indent=2)
             logger.info(f"索引已保存至 {save_path}")
     
-    def search(self, query: str, top_k: int = 5) -> List[Tuple[Dict, float]]:
+    @property
+    def ready(self) -> bool:
+        """向量检索是否可用；只检查状态，不触发加载（需先 load() 或经由 search/encode_query 加载）"""
+        return self.index is not None and self.embeddings_model is not None
+    
+    def encode_query(self, query: str):
+        """编码查询文本，返回 (1, d) 的 float32 归一化向量"""
+        self._ensure_loaded()
+        import numpy as np
+        
+        embedding = self.embeddings_model.encode([query], normalize_embeddings=True)
+        return np.asarray(embedding, dtype='float32').reshape(1, -1)
+    
+    def search(self, query: str, top_k: int = 5, query_embedding=None) -> List[Tuple[Dict, float]]:
         """
         搜索相关文档
         
         Args:
             query: 查询文本
             top_k: 返回前k个结果
+            query_embedding: 预先算好的归一化查询向量（如来自 EmbedBatcher），为空时现场编码
             
         Returns:
             (文档, 相似度分数) 列表
         """
-        import faiss
         import numpy as np
         
-        if not self.index or not self.embeddings_model:
+        self._ensure_loaded()
+        if not self.ready:
             return []
         
-        # 生成查询向量
-        query_embedding = self.embeddings_model.encode([query])
-        query_embedding = np.array(query_embedding).astype('float32')
-        faiss.normalize_L2(query_embedding)
+        # 生成查询向量（编码时直接归一化，无需再单独 normalize_L2）
+        if query_embedding is None:
+            query_embedding = self.encode_query(query)
+        query_embedding = _as_query_vector(query_embedding)
+        
+        # 有损量化索引：多取候选后用原始向量重排，找回量化损失的召回
+        rerank = self.embeddings is not None and self._lossy
         
         # 搜索
-        scores, indices = self.index.search(query_embedding, top_k)
+        scores, indices = self.index.search(query_embedding, top_k * RERANK_FACTOR if rerank else top_k)
         
-        results = []
-        for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-            if idx < len(self.documents):
-                results.append((self.documents[idx], float(score)))
+        # 近似索引结果不足时以 -1 补位
+        hits = [(float(score), int(idx)) for score, idx in zip(scores[0], indices[0])
+                if 0 <= idx < len(self.documents)]
         
-        return results
+        if rerank and hits:
+            ids = [idx for _, idx in hits]
+            exact = np.asarray(self.embeddings[ids], dtype='float32') @ query_embedding[0]
+            hits = sorted(zip(exact.tolist(), ids), reverse=True)[:top_k]
+        
+        return [(self.documents[idx], score) for score, idx in hits]
 
 
 class ICHRAGEngine:
@@ -219,10 +624,13 @@ class ICHRAGEngine:
     融合知识图谱和向量检索
     """
     
-    def __init__(self, neo4j_config: Dict = None, vector_index_path: str = None):
-        """初始化RAG引擎"""
+    def __init__(self, neo4j_config: Dict = None, vector_index_path: str = None,
+                 kg: Neo4jKnowledgeGraph = None):
+        """初始化RAG引擎，传入 kg 时复用其连接池"""
         # 知识图谱
-        if neo4j_config:
+        if kg:
+            self.kg = kg
+        elif neo4j_config:
             self.kg = Neo4jKnowledgeGraph(**neo4j_config)
         else:
             self.kg = Neo4jKnowledgeGraph()
@@ -230,77 +638,89 @@ class ICHRAGEngine:
         # 向量检索
         self.retriever = VectorRetriever(vector_index_path)
         
-        # 类别关键词映射
-        self.category_keywords = {
-            '民间文学': ['传说', '故事', '歌谣', '史诗', '神话', '谚语', '童谣'],
-            '传统音乐': ['音乐', '民歌', '号子', '曲艺', '器乐', '古琴', '唢呐'],
-            '传统舞蹈': ['舞蹈', '龙舞', '狮舞', '秧歌', '傩舞', '花鼓'],
-            '传统戏剧': ['戏剧', '京剧', '昆曲', '越剧', '皮影戏', '木偶'],
-            '曲艺': ['曲艺', '相声', '评书', '大鼓', '快板'],
-            '传统美术': ['美术', '剪纸', '年画', '刺绣', '雕刻', '泥塑'],
-            '传统技艺': ['技艺', '织造', '酿造', '制茶', '制瓷', '铸造'],
-            '传统医药': ['医药', '中医', '针灸', '推拿', '药物'],
-            '民俗': ['民俗', '节日', '习俗', '祭祀', '婚俗']
-        }
+        # 检索结果缓存（精确 + 语义两级）；语义命中仅在查询意图一致时采用，
+        # 避免"北京的非遗"复用"上海的非遗"的知识图谱结果
+        self._retrieval_cache = SemanticCache(
+            threshold=RETRIEVAL_CACHE_THRESHOLD, ttl=RETRIEVAL_CACHE_TTL, maxsize=4096
+        )
+        self._retrieval_cache_version = self.retriever.version
+        
+        # 同步检索时知识图谱查询在此线程池中执行，与向量检索并行
+        self._kg_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='kg-lookup')
     
     def _extract_query_intent(self, query: str) -> Dict:
         """
-        解析查询意图
+        解析查询意图（结果按查询文本缓存）
         
         Returns:
             {'type': 'name/category/region', 'keyword': '...'}
         """
-        # 检测类别查询
-        for category, keywords in self.category_keywords.items():
-            if category in query:
-                return {'type': 'category', 'keyword': category}
-            for kw in keywords:
-                if kw in query:
-                    return {'type': 'category', 'keyword': category}
-        
-        # 检测地区查询
-        provinces = ['北京', '天津', '河北', '山西', '内蒙古', '辽宁', '吉林', '黑龙江',
-                    '上海', '江苏', '浙江', '安徽', '福建', '江西', '山东', '河南',
-                    '湖北', '湖南', '广东', '广西', '海南', '重庆', '四川', '贵州',
-                    '云南', '西藏', '陕西', '甘肃', '青海', '宁夏', '新疆']
-        
-        for province in provinces:
-            if province in query:
-                return {'type': 'region', 'keyword': province}
-        
-        # 默认按名称查询
-        return {'type': 'name', 'keyword': query}
-    
-    def retrieve(self, query: str) -> Dict:
+        intent_type, keyword = _match_intent(query)
+        return {'type': intent_type, 'keyword': keyword}
+    
+    def _retrieval_cache_key(self, query: str) -> str:
+        """规范化缓存键；向量索引重建/重新加载后清空缓存"""
+        if self.retriever.version != self._retrieval_cache_version:
+            self._retrieval_cache.clear()
+            self._retrieval_cache_version = self.retriever.version
+        return query.strip().lower()
+    
+    def invalidate_retrieval_cache(self):
+        """知识图谱数据变更后调用"""
+        self._retrieval_cache.clear()
+    
+    def retrieve(self, query: str, query_embedding=None) -> Dict:
         """
-        混合检索
+        混合检索（结果带缓存）
         
         Args:
             query: 用户查询
+            query_embedding: 预先算好的归一化查询向量，可选
             
         Returns:
             检索结果
         """
+        key = self._retrieval_cache_key(query)
+        cached_retrieval = self._retrieval_cache.get(key)
+        if cached_retrieval is not None:
+            return cached_retrieval
+        
         intent = self._extract_query_intent(query)
         logger.info(f"查询意图: {intent}")
         
-        # 知识图谱检索
-        kg_results = []
-        if intent['type'] == 'category':
-            kg_results = self.kg.query_by_category(intent['keyword'])
-        elif intent['type'] == 'region':
-            kg_results = self.kg.query_by_region(intent['keyword'])
-        else:
-            kg_results = self.kg.query_by_name(intent['keyword'])
-        
-        # 向量检索
-        vector_results = self.retriever.search(query, top_k=3)
-        
-        return {
+        # 知识图谱检索（Bolt 往返）与查询编码 + 向量检索互不依赖：前者交给线程池，后者在当前线程执行
+        kg_future = self._kg_executor.submit(self._kg_lookup, intent)
+        
+        # 查询向量既用于语义缓存查找，也用于向量检索，只编码一次
+        if query_embedding is None and self.retriever.load().ready:
+            query_embedding = self.retriever.encode_query(query)
+        if query_embedding is not None:
+            query_embedding = _as_query_vector(query_embedding)
+            cached_retrieval = self._retrieval_cache.get(
+                key, query_embedding, accept=lambda cached: cached['intent'] == intent
+            )
+            if cached_retrieval is not None:
+                kg_future.cancel()
+                return cached_retrieval
+        
+        vector_results = self.retriever.search(query, top_k=3, query_embedding=query_embedding)
+        kg_results = kg_future.result()
+        
+        retrieval = {
             'intent': intent,
             'kg_results': kg_results,
             'vector_results': [(doc, score) for doc, score in vector_results]
         }
+        self._retrieval_cache.put(key, retrieval, query_embedding)
+        return retrieval
+    
+    def _kg_lookup(self, intent: Dict) -> List[Dict]:
+        """按查询意图检索知识图谱"""
+        if intent['type'] == 'category':
+            return self.kg.query_by_category(intent['keyword'])
+        elif intent['type'] == 'region':
+            return self.kg.query_by_region(intent['keyword'])
+        return self.kg.query_by_name(intent['keyword'])
     
     def generate_context(self, retrieval: Dict) -> str:
         """将检索结果转换为上下文文本"""
@@ -326,6 +746,32 @@ class ICHRAGEngine:
         
         return '\n'.join(context_parts)
     
+    def build_prompt(self, query: str, retrieval: Dict) -> str:
+        """根据检索结果构造大模型问答提示词"""
+        return ANSWER_PROMPT_TPL.format(context=self.generate_context(retrieval), query=query)
+    
+    def _answer_without_llm(self, query: str, retrieval: Dict) -> Dict:
+        """没有大模型时，直接拼接检索结果作为回答"""
+        if not retrieval['kg_results'] and not retrieval['vector_results']:
+            return {
+                'answer': f"抱歉，未找到与'{query}'相关的非遗信息。",
+                'sources': [],
+                'retrieval': retrieval
+            }
+        
+        # 简单拼接回答
+        answer_parts = []
+        if retrieval['kg_results']:
+            answer_parts.append(f"找到 {len(retrieval['kg_results'])} 个相关非遗项目：")
+            for item in retrieval['kg_results'][:5]:
+                answer_parts.append(f"• **{item.get('名称', '')}** ({item.get('类别', '')})")
+        
+        return {
+            'answer': '\n'.join(answer_parts),
+            'sources': [item.get('名称', '') for item in retrieval['kg_results'][:5]],
+            'retrieval': retrieval
+        }
+    
     def answer(self, query: str, llm_func: callable = None) -> Dict:
         """
         完整的问答流程
@@ -343,42 +789,92 @@ class ICHRAGEngine:
         """
         # 检索
         retrieval = self.retrieve(query)
-        context = self.generate_context(retrieval)
         
         # 如果没有大模型，返回结构化结果
         if not llm_func:
-            if not retrieval['kg_results'] and not retrieval['vector_results']:
-                return {
-                    'answer': f"抱歉，未找到与'{query}'相关的非遗信息。",
-                    'sources': [],
-                    'retrieval': retrieval
-                }
-            
-            # 简单拼接回答
-            answer_parts = []
-            if retrieval['kg_results']:
-                answer_parts.append(f"找到 {len(retrieval['kg_results'])} 个相关非遗项目：")
-                for item in retrieval['kg_results'][:5]:
-                    answer_parts.append(f"• **{item.get('名称', '')}** ({item.get('类别', '')})")
-            
+            return self._answer_without_llm(query, retrieval)
+        
+        # 使用大模型生成回答
+        prompt = self.build_prompt(query, retrieval)
+        
+        try:
+            answer = llm_func(prompt)
             return {
-                'answer': '\n'.join(answer_parts),
+                'answer': answer,
                 'sources': [item.get('名称', '') for item in retrieval['kg_results'][:5]],
                 'retrieval': retrieval
             }
+        except Exception as e:
+            logger.error(f"大模型调用失败: {e}")
+            return {
+                'answer': "抱歉，生成回答时出现错误。",
+                'sources': [],
+                'retrieval': retrieval
+            }
+    
+    async def retrieve_async(self, query: str, embed_func: callable = None) -> Dict:
+        """
+        异步混合检索（结果带缓存），知识图谱与向量检索两路互不依赖，并发执行
         
-        # 使用大模型生成回答
-        prompt = f"""你是一位中国非物质文化遗产专家，请根据以下参考信息回答用户问题。
-
-参考信息：
-{context}
-
-用户问题：{query}
-
-请给出准确、专业的回答，如果参考信息不足，请诚实说明。"""
+        Args:
+            query: 用户查询
+            embed_func: 异步查询向量编码函数（如 EmbedBatcher.encode），为空时在检索线程内编码
+        """
+        key = self._retrieval_cache_key(query)
+        cached_retrieval = self._retrieval_cache.get(key)
+        if cached_retrieval is not None:
+            return cached_retrieval
         
+        intent = self._extract_query_intent(query)
+        logger.info(f"查询意图: {intent}")
+        
+        # 知识图谱查询先行启动，与查询编码、向量检索重叠
+        kg_task = asyncio.ensure_future(asyncio.to_thread(self._kg_lookup, intent))
+        
+        query_embedding = None
         try:
-            answer = llm_func(prompt)
+            if embed_func and not self.retriever.ready:
+                # 向量检索器首次使用时在线程中加载，不阻塞事件循环
+                await asyncio.to_thread(self.retriever.load)
+            if embed_func and self.retriever.ready:
+                query_embedding = _as_query_vector(await embed_func(query))
+                cached_retrieval = self._retrieval_cache.get(
+                    key, query_embedding, accept=lambda cached: cached['intent'] == intent
+                )
+                if cached_retrieval is not None:
+                    kg_task.cancel()
+                    return cached_retrieval
+            
+            kg_results, vector_results = await asyncio.gather(
+                kg_task,
+                asyncio.to_thread(self.retriever.search, query, 3, query_embedding)
+            )
+        except BaseException:
+            kg_task.cancel()
+            raise
+        
+        retrieval = {
+            'intent': intent,
+            'kg_results': kg_results,
+            'vector_results': list(vector_results)
+        }
+        self._retrieval_cache.put(key, retrieval, query_embedding)
+        return retrieval
+    
+    async def answer_async(self, query: str, llm_func: callable, embed_func: callable = None) -> Dict:
+        """
+        异步问答流程，检索在线程中执行，大模型调用直接 await
+        
+        Args:
+            query: 用户问题
+            llm_func: 异步大模型调用函数，接收(prompt) -> awaitable[response]
+            embed_func: 异步查询向量编码函数，可选
+        """
+        retrieval = await self.retrieve_async(query, embed_func)
+        prompt = self.build_prompt(query, retrieval)
+        
+        try:
+            answer = await llm_func(prompt)
             return {
                 'answer': answer,
                 'sources': [item.get('名称', '') for item in retrieval['kg_results'][:5]],
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大模型调用语义缓存
+
+两级缓存：
+1. L1 精确缓存 - 提示词 SHA-256 → 回答
+2. L2 语义缓存 - 提示词向量余弦相似度 ≥ 阈值时复用已有回答
+
+用法（同步或异步函数均可）：
+    @semantic_cache(threshold=0.92, ttl=3600)
+    async def generate(prompt: str) -> str:
+        ...
+
+被装饰函数抛出异常时不写入缓存；向量编码失败时跳过 L2，直接调用被装饰函数。
+
+注意：嵌入模型会截断长文本（MiniLM 为 128 token），且整段提示词的向量主要由固定模板决定。
+对"长模板 + 末尾少量变量"的提示词，不同请求的向量几乎相同，L2 会返回别的请求的回答，
+这类提示词应使用 semantic=False 只保留 L1 精确缓存。
+"""
+
+import asyncio
+import hashlib
+import inspect
+import threading
+import functools
+import logging
+from typing import Callable, List, Optional
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+# L2 查询的候选数，跳过索引中已失效的条目
+L2_CANDIDATES = 4
+
+
+def _prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+class SemanticCache:
+    """L1精确 + L2语义 两级提示词缓存"""
+
+    def __init__(self, threshold: float = 0.92, ttl: int = 3600, maxsize: int = 1024,
+                 semantic: bool = True):
+        """
+        Args:
+            threshold: L2 命中所需的最小余弦相似度
+            ttl: 缓存有效期（秒）
+            maxsize: 最多缓存的回答条数
+            semantic: 是否启用 L2 语义缓存，为 False 时只做 L1 精确匹配
+        """
+        self.threshold = threshold
+        self.semantic = semantic
+        self.maxsize = maxsize
+        self._responses = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+        # L2：向量索引中第 i 行对应 _index_keys[i]
+        self._index = None
+        self._index_keys: List[str] = []
+        self._vectors = []
+
+    def embed(self, prompt: str):
+        """生成归一化的提示词向量，未启用 L2 或模型不可用时返回 None"""
+        if not self.semantic:
+            return None
+        try:
+            from rag_engine import get_embedding_model
+
+            return self.normalize(get_embedding_model().encode([prompt]))
+        except ImportError:
+            return None
+        except Exception as e:
+            # 缓存故障不应影响正常调用
+            logger.warning(f"提示词向量编码失败，跳过语义缓存: {e!r}")
+            return None
+
+    @staticmethod
+    def normalize(vector):
+        """转为 (1, d) 的 float32 并做 L2 归一化，供内积索引使用"""
+        import faiss
+        import numpy as np
+
+        embedding = np.array(vector).astype('float32').reshape(1, -1)
+        faiss.normalize_L2(embedding)
+        return embedding
+
+    def _rebuild_index(self):
+        """剔除已过期的条目并重建 L2 索引"""
+        import faiss
+        import numpy as np
+
+        live = [(k, v) for k, v in zip(self._index_keys, self._vectors) if k in self._responses]
+        self._index_keys = [k for k, _ in live]
+        self._vectors = [v for _, v in live]
+        self._index = None
+        if self._vectors:
+            vectors = np.vstack(self._vectors)
+            self._index = faiss.IndexFlatIP(vectors.shape[1])
+            self._index.add(vectors)
+
+    def get(self, prompt: str, embedding=None, accept: Callable = None) -> Optional[str]:
+        """
+        查询缓存，未命中返回 None（值通常为回答文本，也可缓存其他对象，如检索结果）
+
+        Args:
+            accept: 可选的校验函数，L2 命中的值仅在 accept(value) 为真时返回并回填 L1
+        """
+        key = _prompt_key(prompt)
+        with self._lock:
+            response = self._responses.get(key)
+            if response is not None:
+                return response
+
+            if (not self.semantic or embedding is None
+                    or self._index is None or self._index.ntotal == 0):
+                return None
+
+            # 索引中可能残留已过期/被淘汰的条目，多取几个候选跳过它们
+            scores, indices = self._index.search(embedding, min(L2_CANDIDATES, self._index.ntotal))
+            for score, idx in zip(scores[0].tolist(), indices[0].tolist()):
+                if idx < 0 or score < self.threshold:
+                    break
+                response = self._responses.get(self._index_keys[idx])
+                if response is None:
+                    continue
+                if accept is not None and not accept(response):
+                    return None
+                # 回填 L1，下次同样的提示词直接精确命中
+                self._responses[key] = response
+                logger.info(f"语义缓存命中，相似度: {score:.3f}")
+                return response
+            return None
+
+    def put(self, prompt: str, response: str, embedding=None):
+        """写入缓存"""
+        key = _prompt_key(prompt)
+        with self._lock:
+            self._responses[key] = response
+            if not self.semantic or embedding is None:
+                return
+
+            # 缓存满后每次写入都会淘汰一条，留出一倍余量再批量剔除，避免每次写入都重建索引
+            if len(self._index_keys) >= 2 * self.maxsize:
+                self._rebuild_index()
+            if self._index is None:
+                import faiss
+                self._index = faiss.IndexFlatIP(embedding.shape[1])
+            self._index.add(embedding)
+            self._index_keys.append(key)
+            self._vectors.append(embedding)
+
+    def clear(self):
+        with self._lock:
+            self._responses.clear()
+            self._index = None
+            self._index_keys = []
+            self._vectors = []
+
+
+def semantic_cache(threshold: float = 0.92, ttl: int = 3600, maxsize: int = 1024,
+                   semantic: bool = True) -> Callable:
+    """
+    为 prompt -> str 的大模型调用函数添加两级缓存
+
+    Args:
+        semantic: 是否启用 L2 语义缓存，模板化的提示词应关闭（见模块说明）
+    """
+    def decorator(func: Callable[[str], str]) -> Callable[[str], str]:
+        cache = SemanticCache(threshold=threshold, ttl=ttl, maxsize=maxsize, semantic=semantic)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(prompt: str) -> str:
+                response = cache.get(prompt)
+                if response is not None:
+                    return response
+
+                embedding = None
+                if cache.semantic:
+                    # 向量编码是CPU密集操作，放到线程中避免阻塞事件循环
+                    embedding = await asyncio.to_thread(cache.embed, prompt)
+                if embedding is not None:
+                    response = cache.get(prompt, embedding)
+                    if response is not None:
+                        return response
+
+                response = await func(prompt)
+                cache.put(prompt, response, embedding)
+                return response
+        else:
+            @functools.wraps(func)
+            def wrapper(prompt: str) -> str:
+                response = cache.get(prompt)
+                if response is not None:
+                    return response
+
+                embedding = cache.embed(prompt)
+                if embedding is not None:
+                    response = cache.get(prompt, embedding)
+                    if response is not None:
+                        return response
+
+                response = func(prompt)
+                cache.put(prompt, response, embedding)
+                return response
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -100,32 +100,48 @@ async function sendMessage() {
     const loadingId = addFunctionMessage('正在思考中...', 'ai');
 
     try {
-        const response = await fetch('/api/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                message: query,
-                use_ai: useRAG
-            })
-        });
+        if (!useRAG) {
+            const response = await fetch('/api/chat', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    message: query,
+                    use_ai: useRAG
+                })
+            });
 
-        const data = await response.json();
+            const data = await response.json();
 
-        // Remove Loading Message
-        const loadingEl = document.getElementById(loadingId);
-        if (loadingEl) loadingEl.remove();
+            // Remove Loading Message
+            const loadingEl = document.getElementById(loadingId);
+            if (loadingEl) loadingEl.remove();
 
-        // Display AI Response
-        if (data.answer) {
-            addMessage(data.answer, 'ai');
-        } else if (data.error) {
-            addMessage('抱歉，出错了：' + data.error, 'ai');
+            // Display AI Response
+            if (data.answer) {
+                addMessage(data.answer, 'ai');
+            } else if (data.error) {
+                addMessage('抱歉，出错了：' + data.error, 'ai');
+            }
+            return;
         }
+
+        // Stream AI Response into the loading message
+        const content = document.querySelector(`#${loadingId} .content`);
+        let text = '';
+        await streamPost('/api/chat', { message: query, use_ai: useRAG }, event => {
+            if (event.delta) {
+                text += event.delta;
+                content.innerHTML = text.replace(/\n/g, '<br>');
+                chatHistory.scrollTop = chatHistory.scrollHeight;
+            }
+        });
     } catch (error) {
         console.error('Error:', error);
-        addMessage('网络请求失败，请稍后再试。', 'ai');
+        const loadingEl = document.getElementById(loadingId);
+        if (loadingEl) loadingEl.remove();
+        addMessage(error.fromServer ? '抱歉，出错了：' + error.message : '网络请求失败，请稍后再试。', 'ai');
     }
 }
 
@@ -159,6 +175,54 @@ function addFunctionMessage(text, type) {
     return addMessage(text, type);
 }
 
+// ==================== 流式请求 (SSE over POST) ====================
+// 以 stream: true 调用生成接口，每收到一个 data 事件就回调 onEvent(event)
+async function streamPost(url, body, onEvent) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...body, stream: true })
+    });
+
+    if (!response.ok || !response.body) {
+        const data = await response.json();
+        const error = new Error(data.error || response.statusText);
+        // 服务端返回的错误信息（如参数无效、重复提交）可直接展示给用户
+        error.fromServer = Boolean(data.error);
+        throw error;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        events.forEach(event => {
+            if (event.startsWith('data:')) {
+                onEvent(JSON.parse(event.slice(5)));
+            }
+        });
+    }
+}
+
+// 把流式文本逐段写入结果框
+async function streamInto(url, body, resultBox) {
+    let text = '';
+    await streamPost(url, body, event => {
+        if (event.delta) {
+            text += event.delta;
+            resultBox.innerHTML = text.replace(/\n/g, '<br>');
+        }
+    });
+    if (!text) resultBox.innerHTML = '生成失败';
+}
+
 // Graph Visualization (ECharts)
 let myChart = null;
 
@@ -277,19 +341,12 @@ async function generateWenchuang() {
     resultBox.innerHTML = '✨ AI正在为您构思创意方案...';
 
     try {
-        const response = await fetch('/api/creative', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                type: product || '文创产品',
-                item_name: project
-            })
-        });
-
-        const data = await response.json();
-        resultBox.innerHTML = data.content ? data.content.replace(/\n/g, '<br>') : '生成失败';
+        await streamInto('/api/creative', {
+            type: product || '文创产品',
+            item_name: project
+        }, resultBox);
     } catch (e) {
-        resultBox.innerHTML = '请求失败，请检查网络连接。';
+        resultBox.innerHTML = e.fromServer ? '请求失败：' + e.message : '请求失败，请检查网络连接。';
     }
 }
 
@@ -306,16 +363,9 @@ async function generateWenmai() {
     resultBox.innerHTML = '📜 AI正在追溯历史脉络...';
 
     try {
-        const response = await fetch('/api/wenmai', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ project_name: project })
-        });
-
-        const data = await response.json();
-        resultBox.innerHTML = data.content ? data.content.replace(/\n/g, '<br>') : '生成失败';
+        await streamInto('/api/wenmai', { project_name: project }, resultBox);
     } catch (e) {
-        resultBox.innerHTML = '请求失败，请检查网络连接。';
+        resultBox.innerHTML = e.fromServer ? '请求失败：' + e.message : '请求失败，请检查网络连接。';
     }
 }
 
@@ -333,19 +383,12 @@ async function generateWenxue() {
     resultBox.innerHTML = `✒️ AI正在创作${type}...`;
 
     try {
-        const response = await fetch('/api/wenxue', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-                theme: theme,
-                type: type
-            })
-        });
-
-        const data = await response.json();
-        resultBox.innerHTML = data.content ? data.content.replace(/\n/g, '<br>') : '生成失败';
+        await streamInto('/api/wenxue', {
+            theme: theme,
+            type: type
+        }, resultBox);
     } catch (e) {
-        resultBox.innerHTML = '请求失败，请检查网络连接。';
+        resultBox.innerHTML = e.fromServer ? '请求失败：' + e.message : '请求失败，请检查网络连接。';
     }
 }
 // ==================== Heritage Overview ====================
@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生产环境入口（Gunicorn 请直接使用 gunicorn_conf.py，由其在各 worker 中初始化引擎）
+
+使用方法:
+    hypercorn wsgi:app --workers 1 --worker-class asyncio
+"""
+
+from app import app, init_engines
+
+init_engines()